@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+
+def default_cache_is_shared():
+    return (
+        settings.CACHES["default"]["BACKEND"]
+        not in settings.PROCESS_LOCAL_CACHE_BACKENDS
+    )
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Table versions in the default cache must reach every worker."""
+    if default_cache_is_shared():
+        return []
+    return [
+        Warning(
+            "The default cache is local to each process, so other workers "
+            "and management commands never see its table versions.",
+            hint=(
+                "Set CACHE_BACKEND to a backend shared by all workers, e.g. "
+                "the file-based default on one host or memcached."
+            ),
+            id="api.W001",
+        )
+    ]
+
+
+@register()
+def check_perf_cache(app_configs, **kwargs):
+    """Performance samples of every worker are merged in the default cache."""
+    if not settings.PERF_MIDDLEWARE or default_cache_is_shared():
+        return []
+    return [
+        Error(
+            "PERF_MIDDLEWARE needs a default cache shared by all workers, "
+            "otherwise perf_report only sees its own empty process.",
+            hint="Set CACHE_BACKEND to a shared backend.",
+            id="api.E001",
+        )
+    ]
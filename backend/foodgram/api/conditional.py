@@ -0,0 +1,103 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription
+from .memberships import is_member
+
+VERSION_CACHE_KEY = "version:{}"
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Version of a table: time of its last change in milliseconds.
+
+    Versions live in the default cache, which every worker must share, and
+    are bumped after the change commits. A version missing from the cache
+    restarts at the current time, so it never repeats a value a client may
+    still hold.
+    """
+    return cache.get_or_set(VERSION_CACHE_KEY.format(name), now_ms, None)
+
+
+def get_versions(names):
+    """Versions of several tables, read from the cache in one call."""
+    keys = {name: VERSION_CACHE_KEY.format(name) for name in names}
+    found = cache.get_many(keys.values())
+    return [
+        found[key] if key in found else get_version(name)
+        for name, key in keys.items()
+    ]
+
+
+def bump_version(name):
+    key = VERSION_CACHE_KEY.format(name)
+    cache.set(key, max(now_ms(), (cache.get(key) or 0) + 1), None)
+
+
+def from_ms(value):
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def table_condition(name):
+    """Conditional GET for views of a table with a version counter."""
+    return condition(
+        etag_func=lambda request, *args, **kwargs: (
+            f'"{name}-{get_version(name)}"'
+        ),
+        last_modified_func=lambda request, *args, **kwargs: from_ms(
+            get_version(name)
+        ),
+    )
+
+
+def recipe_etag(request, pk=None, **kwargs):
+    recipe = (
+        Recipe.objects.filter(pk=pk).values("updated_at", "author_id").first()
+    )
+    if recipe is None:
+        return None
+    flags = "".join(
+        "1" if is_member(request, model, value) else "0"
+        for model, value in (
+            (Favorite, int(pk)),
+            (ShoppingCart, int(pk)),
+            (Subscription, recipe["author_id"]),
+        )
+    )
+    return (
+        f'"recipe-{pk}-{recipe["updated_at"].timestamp()}'
+        f'-{get_version("tags")}-{get_version("ingredients")}-{flags}"'
+    )
+
+
+def recipe_last_modified(request, pk=None, **kwargs):
+    """Last-Modified is only sent to anonymous users.
+
+    Flags of authenticated users change without touching the recipe, so
+    they rely on the ETag alone.
+    """
+    if request.user.is_authenticated:
+        return None
+    updated_at = (
+        Recipe.objects.filter(pk=pk)
+        .values_list("updated_at", flat=True)
+        .first()
+    )
+    if updated_at is None:
+        return None
+    return max(
+        updated_at,
+        from_ms(get_version("tags")),
+        from_ms(get_version("ingredients")),
+    )
+
+
+recipe_condition = condition(
+    etag_func=recipe_etag, last_modified_func=recipe_last_modified
+)
@@ -0,0 +1,284 @@
+import threading
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from recipes.models import Recipe, RecipeIngredient
+from .conditional import bump_version, get_version
+
+REFRESH_MARGIN = timedelta(minutes=1)
+
+
+def popcount(bitmap):
+    return bin(bitmap).count("1")
+
+
+def bitmap_from(positions, size):
+    data = bytearray((size >> 3) + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, "little")
+
+
+def add_planes(planes, bitmap):
+    """Add one to the bit-sliced counters of every position in bitmap."""
+    carry = bitmap
+    for index, plane in enumerate(planes):
+        planes[index] = plane ^ carry
+        carry &= plane
+        if not carry:
+            return
+    planes.append(carry)
+
+
+def subtract_planes(minuend, subtrahend):
+    """Bit-sliced minuend - subtrahend, both counters per position."""
+    result = []
+    borrow = 0
+    for index in range(max(len(minuend), len(subtrahend))):
+        left = minuend[index] if index < len(minuend) else 0
+        right = subtrahend[index] if index < len(subtrahend) else 0
+        result.append(left ^ right ^ borrow)
+        borrow = (~left & (right | borrow)) | (right & borrow)
+    return result
+
+
+def equal_to(planes, value, mask):
+    """Positions of mask whose bit-sliced counter equals value."""
+    for index, plane in enumerate(planes):
+        mask &= plane if value >> index & 1 else ~plane
+        if not mask:
+            break
+    if value >> len(planes):
+        return 0
+    return mask
+
+
+class Matches:
+    """Lazily ordered (recipe id, missing count) pairs of a coverage query.
+
+    Buckets of equal missing count, then equal matched count, are bitmaps
+    over recipe positions; positions within a bucket are read from the
+    highest (newest recipe) down. Supports len() and slicing for paginators.
+    """
+
+    def __init__(self, ids, matched, have, missing, most_missing):
+        self.ids = ids
+        self.matched = matched
+        self.have = have
+        self.missing = missing
+        self.most_missing = most_missing
+        if most_missing >= (1 << len(missing)) - 1:
+            self.count = popcount(matched)
+        else:
+            self.count = sum(
+                popcount(equal_to(missing, value, matched))
+                for value in range(most_missing + 1)
+            )
+
+    def buckets(self):
+        for value in range(self.most_missing + 1):
+            rest = equal_to(self.missing, value, self.matched)
+            for count in range((1 << len(self.have)) - 1, 0, -1):
+                if not rest:
+                    break
+                bucket = equal_to(self.have, count, rest)
+                if bucket:
+                    rest &= ~bucket
+                    yield value, bucket
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop, _ = key.indices(self.count)
+        wanted = max(stop - start, 0)
+        results = []
+        for missing, bucket in self.buckets():
+            if len(results) >= wanted:
+                break
+            if not results:
+                size = popcount(bucket)
+                if start >= size:
+                    start -= size
+                    continue
+            while bucket and len(results) < wanted:
+                position = bucket.bit_length() - 1
+                bucket ^= 1 << position
+                if start:
+                    start -= 1
+                else:
+                    results.append((self.ids[position], missing))
+        return results
+
+
+class CookableIndex:
+    """Process-local inverted index from ingredients to recipes using them.
+
+    Recipes get positions in id order; each ingredient and tag maps to a
+    bitmap of positions, and ingredient counts per recipe are kept as bit
+    planes, so coverage of a pantry is a handful of big-integer operations.
+    The index is built lazily from the primary and refreshed whenever the
+    "recipe_ingredients" version changes: recipes saved since the last
+    refresh are re-read, and a recipe count that no longer matches (a
+    deletion) triggers a full rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._watermark = None
+        self.load([], [], [])
+
+    @staticmethod
+    def invalidate():
+        bump_version("recipe_ingredients")
+
+    def load(self, recipe_ids, ingredient_rows, tag_rows):
+        """Replace the index with (recipe, ingredient), (recipe, slug) rows."""
+        recipes = {recipe_id: ([], []) for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in ingredient_rows:
+            recipes.setdefault(recipe_id, ([], []))[0].append(ingredient_id)
+        for recipe_id, slug in tag_rows:
+            recipes.setdefault(recipe_id, ([], []))[1].append(slug)
+        self.ids = array("l", sorted(recipes))
+        self.positions = {pk: index for index, pk in enumerate(self.ids)}
+        self.recipes = {
+            pk: (tuple(ingredients), tuple(slugs))
+            for pk, (ingredients, slugs) in recipes.items()
+        }
+        ingredients = defaultdict(list)
+        tags = defaultdict(list)
+        totals = defaultdict(list)
+        for pk, (ingredient_ids, slugs) in self.recipes.items():
+            position = self.positions[pk]
+            for ingredient_id in ingredient_ids:
+                ingredients[ingredient_id].append(position)
+            for slug in slugs:
+                tags[slug].append(position)
+            for plane in range(len(ingredient_ids).bit_length()):
+                if len(ingredient_ids) >> plane & 1:
+                    totals[plane].append(position)
+        size = len(self.ids)
+        self.ingredients = defaultdict(int, {
+            pk: bitmap_from(positions, size)
+            for pk, positions in ingredients.items()
+        })
+        self.tags = defaultdict(int, {
+            slug: bitmap_from(positions, size)
+            for slug, positions in tags.items()
+        })
+        self.totals = [
+            bitmap_from(totals[plane], size)
+            for plane in range(max(totals) + 1 if totals else 0)
+        ]
+
+    def add(self, recipe_id, ingredient_ids, slugs):
+        position = self.positions.get(recipe_id)
+        if position is None:
+            position = self.positions[recipe_id] = len(self.ids)
+            self.ids.append(recipe_id)
+        bit = 1 << position
+        old_ingredients, old_slugs = self.recipes.get(recipe_id, ((), ()))
+        for ingredient_id in old_ingredients:
+            self.ingredients[ingredient_id] &= ~bit
+        for slug in old_slugs:
+            self.tags[slug] &= ~bit
+        for ingredient_id in ingredient_ids:
+            self.ingredients[ingredient_id] |= bit
+        for slug in slugs:
+            self.tags[slug] |= bit
+        count = len(ingredient_ids)
+        while len(self.totals) < count.bit_length():
+            self.totals.append(0)
+        for plane in range(len(self.totals)):
+            if count >> plane & 1:
+                self.totals[plane] |= bit
+            else:
+                self.totals[plane] &= ~bit
+        self.recipes[recipe_id] = (tuple(ingredient_ids), tuple(slugs))
+
+    @staticmethod
+    def rows(recipe_ids=None):
+        ingredients = RecipeIngredient.objects.using("default").values_list(
+            "recipe_id", "ingredient_id"
+        )
+        tags = Recipe.tags.through.objects.using("default").values_list(
+            "recipe_id", "tag__slug"
+        )
+        if recipe_ids is not None:
+            ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+            tags = tags.filter(recipe_id__in=recipe_ids)
+        return ingredients.iterator(), tags.iterator()
+
+    def update(self, recipe_ids):
+        changed = {recipe_id: ([], []) for recipe_id in recipe_ids}
+        ingredient_rows, tag_rows = self.rows(list(changed))
+        for recipe_id, ingredient_id in ingredient_rows:
+            changed[recipe_id][0].append(ingredient_id)
+        for recipe_id, slug in tag_rows:
+            changed[recipe_id][1].append(slug)
+        for recipe_id in sorted(changed):
+            self.add(recipe_id, *changed[recipe_id])
+
+    def rebuild(self):
+        recipes = list(
+            Recipe.objects.using("default")
+            .order_by()
+            .values_list("id", "updated_at")
+        )
+        self.load([pk for pk, _ in recipes], *self.rows())
+        self._watermark = max(
+            (updated_at for _, updated_at in recipes), default=None
+        )
+
+    def refresh(self):
+        if self._watermark is None:
+            self.rebuild()
+            return
+        changed = dict(
+            Recipe.objects.using("default")
+            .filter(updated_at__gte=self._watermark - REFRESH_MARGIN)
+            .values_list("id", "updated_at")
+        )
+        self.update(changed)
+        self._watermark = max(self._watermark, *changed.values())
+        if Recipe.objects.using("default").count() != len(self.recipes):
+            self.rebuild()
+
+    def rank(self, ingredient_ids, tags=(), max_missing=None):
+        """Recipes using any of the ingredients, most complete first.
+
+        Returns Matches ordered by missing ingredients, then by matched
+        ingredients, newest recipes first.
+        """
+        have = []
+        matched = 0
+        for ingredient_id in set(ingredient_ids):
+            bitmap = self.ingredients.get(ingredient_id, 0)
+            matched |= bitmap
+            add_planes(have, bitmap)
+        if tags:
+            allowed = 0
+            for slug in tags:
+                allowed |= self.tags.get(slug, 0)
+            matched &= allowed
+        missing = subtract_planes(self.totals, have)
+        most_missing = (1 << len(missing)) - 1
+        if max_missing is not None:
+            most_missing = min(most_missing, max_missing)
+        return Matches(self.ids, matched, have, missing, most_missing)
+
+    def match(self, ingredient_ids, tags=(), max_missing=None):
+        """Rank recipes after bringing the index up to date."""
+        with self._lock:
+            version = get_version("recipe_ingredients")
+            if version != self._version:
+                self.refresh()
+                self._version = version
+            return self.rank(ingredient_ids, tags, max_missing)
+
+
+cookable_index = CookableIndex()
@@ -0,0 +1,111 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from recipes.images import encode
+
+IMAGE_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif"}
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Image field accepting base64 data, decoded in chunks to a temp file.
+
+    Size and pixel limits are checked before the image is decoded. The
+    stored image is re-encoded without metadata (EXIF, GPS) and scaled down
+    to fit RECIPE_IMAGE_MAX_SIZE.
+    """
+
+    chunk_size = 256 * 1024
+    default_error_messages = {
+        "invalid_base64": "Please upload a valid image.",
+        "invalid_type": "The type of the image couldn't be determined.",
+        "too_large": "Image file must not exceed {max_bytes} bytes.",
+        "too_many_pixels": "Image must not exceed {max_pixels} pixels.",
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail("invalid_base64")
+        header, separator, _ = data[:128].partition(";base64,")
+        start = len(header) + len(separator) if separator else 0
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        if (len(data) - start) // 4 * 3 > max_bytes + 2:
+            self.fail("too_large", max_bytes=max_bytes)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            self.decode(data, start, file)
+            extension = self.check_image(file)
+            file = self.normalize(file)
+        except Exception:
+            file.close()
+            raise
+        size = file.tell()
+        file.seek(0)
+        upload = UploadedFile(
+            file=file,
+            name=f"{uuid.uuid4()}.{extension}",
+            content_type=f"image/{extension}",
+            size=size,
+        )
+        return serializers.FileField.to_internal_value(self, upload)
+
+    def decode(self, data, start, file):
+        carry = ""
+        try:
+            for offset in range(start, len(data), self.chunk_size):
+                chunk = carry + "".join(
+                    data[offset:offset + self.chunk_size].split()
+                )
+                usable = len(chunk) - len(chunk) % 4
+                file.write(base64.b64decode(chunk[:usable], validate=True))
+                carry = chunk[usable:]
+        except binascii.Error:
+            self.fail("invalid_base64")
+        if carry or not file.tell():
+            self.fail("invalid_base64")
+        return file.tell()
+
+    def check_image(self, file):
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        file.seek(0)
+        try:
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            self.fail("too_many_pixels", max_pixels=max_pixels)
+        except OSError:
+            self.fail("invalid_base64")
+        if image.format not in IMAGE_FORMATS:
+            self.fail("invalid_type")
+        width, height = image.size
+        if width * height > max_pixels:
+            self.fail("too_many_pixels", max_pixels=max_pixels)
+        try:
+            image.verify()
+        except Exception:
+            self.fail("invalid_base64")
+        file.seek(0)
+        return IMAGE_FORMATS[image.format]
+
+    @staticmethod
+    def normalize(file):
+        """Metadata-free copy of the image, capped to RECIPE_IMAGE_MAX_SIZE."""
+        image = Image.open(file)
+        fmt = image.format.lower()
+        if fmt == "jpeg":
+            image.draft(image.mode, settings.RECIPE_IMAGE_MAX_SIZE)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(settings.RECIPE_IMAGE_MAX_SIZE, Image.LANCZOS)
+        normalized = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        normalized.write(encode(image, fmt).read())
+        file.close()
+        return normalized
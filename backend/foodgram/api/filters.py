@@ -1,15 +1,17 @@
+from django.db.models import Exists, F, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe
+from recipes.search import search_recipes
 from users.models import User
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = "name"
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class RecipesFilterSet(FilterSet):
+    ids = NumberInFilter(field_name="id")
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all(),
@@ -17,11 +19,26 @@ class RecipesFilterSet(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart",
     )
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.AllValuesMultipleFilter(
+        field_name="tags__slug", method="filter_tags"
+    )
+    search = filters.CharFilter(method="filter_search")
+    ordering = filters.ChoiceFilter(
+        choices=(("popular", "popularity"), ("trending", "trending")),
+        method="order_by_score",
+    )
 
     class Meta:
         model = Recipe
-        fields = ["is_favorited", "author", "is_in_shopping_cart", "tags"]
+        fields = [
+            "ids",
+            "is_favorited",
+            "author",
+            "is_in_shopping_cart",
+            "tags",
+            "search",
+            "ordering",
+        ]
 
     def filter_is_favorited(self, queryset, name, value):
         if value:
@@ -32,3 +49,33 @@ class RecipesFilterSet(FilterSet):
         if value:
             return queryset.filter(is_in_shopping_cart__user=self.request.user)
         return queryset
+
+    def filter_tags(self, queryset, name, value):
+        """Recipes having any of the tags, without a join and DISTINCT.
+
+        A correlated EXISTS keeps the recipes in id order, so the page is
+        read from the top instead of sorting every recipe with the tags.
+        """
+        if not value:
+            return queryset
+        return queryset.annotate(
+            has_tags=Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef("pk"), tag__slug__in=value
+                )
+            )
+        ).filter(has_tags=True)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def order_by_score(self, queryset, name, value):
+        """Order by a RecipeScore index; every recipe has a score row.
+
+        Filtering on the score makes its join an inner one, so the top of
+        the list is read from the (-field, -recipe) index without a sort.
+        """
+        field = "popularity" if value == "popular" else "trending"
+        return queryset.filter(score__isnull=False).order_by(
+            F(f"score__{field}").desc(), F("score__recipe").desc()
+        )
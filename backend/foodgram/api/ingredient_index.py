@@ -0,0 +1,72 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+from .conditional import bump_version, get_version
+
+
+class IngredientPrefixIndex:
+    """Process-local sorted array of ingredient names for autocomplete.
+
+    The index is built lazily from the primary and rebuilt whenever the
+    "ingredients" table version changes. Versions are bumped after commit
+    and kept in the default cache, which must be shared by every worker
+    (see CACHE_BACKEND) for them to notice writes made by the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._items = []
+
+    @staticmethod
+    def invalidate():
+        bump_version("ingredients")
+
+    def _build(self):
+        rows = sorted(
+            (name.lower(), name, pk, measurement_unit)
+            for pk, name, measurement_unit in (
+                Ingredient.objects.using("default")
+                .values_list("id", "name", "measurement_unit")
+                .iterator()
+            )
+        )
+        keys = [row[0] for row in rows]
+        items = [
+            {"id": pk, "name": name, "measurement_unit": measurement_unit}
+            for _, name, pk, measurement_unit in rows
+        ]
+        return keys, items
+
+    def _snapshot(self):
+        version = get_version("ingredients")
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._keys, self._items = self._build()
+                    self._version = version
+        return self._keys, self._items
+
+    def search(self, query="", limit=None):
+        """Return prefix matches first, then substring matches."""
+        keys, items = self._snapshot()
+        query = query.lower()
+        if not query:
+            return items[:limit]
+        start = end = bisect_left(keys, query)
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        results = items[start:end]
+        if limit is not None and len(results) >= limit:
+            return results[:limit]
+        for position, key in enumerate(keys):
+            if query in key and not start <= position < end:
+                results.append(items[position])
+                if len(results) == limit:
+                    break
+        return results
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import socket
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .conditional import bump_version, get_versions
+
+STATS_WORKERS_KEY = "recipe_list_cache:workers"
+STATS_WORKER_KEY = "recipe_list_cache:{}"
+EVENTS = ("hits", "misses")
+SCORES_SCOPE = "recipes:scores"
+RANKED_ORDERINGS = ("popular", "trending")
+
+
+def scope_versions(query_params):
+    """Versions of every scope a recipe list page depends on.
+
+    Pages filtered by tags or author depend only on those tags and author,
+    unfiltered pages depend on every recipe. Popular and trending pages
+    also depend on the recipe scores.
+    """
+    scopes = [f"recipes:tag:{slug}" for slug in query_params.getlist("tags")]
+    if query_params.get("author"):
+        scopes.append(f"recipes:author:{query_params['author']}")
+    names = sorted(set(scopes) or {"recipes:all"}) + ["tags", "ingredients"]
+    if query_params.get("ordering") in RANKED_ORDERINGS:
+        names.append(SCORES_SCOPE)
+    return get_versions(names)
+
+
+def recipe_list_key(request):
+    if not hasattr(request, "recipe_list_key"):
+        request.recipe_list_key = build_recipe_list_key(request)
+    return request.recipe_list_key
+
+
+def build_recipe_list_key(request):
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name in request.query_params
+            for value in request.query_params.getlist(name)
+        )
+    )
+    versions = "-".join(map(str, scope_versions(request.query_params)))
+    digest = hashlib.md5(f"{query}|{versions}".encode()).hexdigest()
+    return f"recipe_list:{request.accepted_media_type}:{digest}"
+
+
+def invalidate_recipe_lists(author_id, slugs):
+    """Expire list pages that may contain a recipe of author with slugs."""
+    bump_version("recipes:all")
+    bump_version(f"recipes:author:{author_id}")
+    for slug in slugs:
+        bump_version(f"recipes:tag:{slug}")
+
+
+def invalidate_ranked_lists():
+    """Expire popular and trending pages once recipe scores change."""
+    bump_version(SCORES_SCOPE)
+
+
+class Stats:
+    """Hits and misses of this process, flushed to the default cache.
+
+    Counting in memory keeps cache writes off the request path; every
+    PERF_FLUSH_INTERVAL seconds the totals are written under a key per
+    process, so any process can add all of them up.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.key = STATS_WORKER_KEY.format(
+            f"{socket.gethostname()}:{os.getpid()}"
+        )
+        self.flushed = time.monotonic()
+
+    def record(self, event):
+        self.counts[event] += 1
+        if time.monotonic() - self.flushed >= settings.PERF_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        cache.set(self.key, dict(self.counts), None)
+        workers = cache.get(STATS_WORKERS_KEY, set())
+        if self.key not in workers:
+            cache.set(STATS_WORKERS_KEY, workers | {self.key}, None)
+
+
+stats = Stats()
+
+
+def get_stats():
+    totals = Counter()
+    for counts in cache.get_many(cache.get(STATS_WORKERS_KEY, set())).values():
+        totals.update(counts)
+    return {event: totals[event] for event in EVENTS}
+
+
+def get_cached_list(request):
+    content = caches["recipe_list"].get(recipe_list_key(request))
+    stats.record("misses" if content is None else "hits")
+    return content
+
+
+def set_cached_list(request, content):
+    caches["recipe_list"].set(recipe_list_key(request), content)
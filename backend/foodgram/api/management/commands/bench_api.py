@@ -0,0 +1,154 @@
+import json
+import random
+import time
+from collections import defaultdict
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryRecorder, percentiles
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+MIX = {
+    "recipes_anonymous": 25,
+    "recipes": 20,
+    "recipes_by_tag": 10,
+    "recipe": 15,
+    "subscriptions": 8,
+    "ingredients": 10,
+    "shopping_list": 4,
+    "favorite_toggle": 8,
+}
+
+
+class Command(BaseCommand):
+    """Custom command to replay a weighted mix of API calls."""
+
+    help = (
+        "Replays a weighted mix of API requests in-process and prints "
+        "latency percentiles, queries per request and throughput as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--warmup", type=int, default=50)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the JSON to this file")
+
+    def prepare(self, users):
+        recipes = list(Recipe.objects.values_list("id", flat=True))
+        if not recipes:
+            raise CommandError("No recipes, run generate_dataset first.")
+        self.recipes = recipes
+        self.pages = max(1, len(recipes) // 6)
+        self.tags = list(Tag.objects.values_list("slug", flat=True))
+        names = Ingredient.objects.values_list("name", flat=True)
+        self.prefixes = sorted({name[:2] for name in names})
+        user_ids = list(User.objects.values_list("id", flat=True))
+        self.clients = []
+        for user in self.random.sample(user_ids, min(users, len(user_ids))):
+            token, _ = Token.objects.get_or_create(user_id=user)
+            self.clients.append(
+                Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+            )
+        self.anonymous = Client()
+
+    def random_page(self):
+        return f"/api/recipes/?page={self.random.randint(1, self.pages)}"
+
+    def call_recipes_anonymous(self, client, recipe):
+        return self.anonymous.get(self.random_page())
+
+    def call_recipes(self, client, recipe):
+        return client.get(self.random_page())
+
+    def call_recipes_by_tag(self, client, recipe):
+        tag = self.random.choice(self.tags)
+        return client.get(f"/api/recipes/?tags={tag}")
+
+    @staticmethod
+    def call_recipe(client, recipe):
+        return client.get(f"/api/recipes/{recipe}/")
+
+    @staticmethod
+    def call_subscriptions(client, recipe):
+        return client.get("/api/users/subscriptions/?recipes_limit=3")
+
+    def call_ingredients(self, client, recipe):
+        prefix = self.random.choice(self.prefixes)
+        return self.anonymous.get(f"/api/ingredients/?name={prefix}")
+
+    @staticmethod
+    def call_shopping_list(client, recipe):
+        response = client.get("/api/recipes/download_shopping_cart/")
+        b"".join(response.streaming_content)
+        return response
+
+    @staticmethod
+    def call_favorite_toggle(client, recipe):
+        client.post(f"/api/recipes/{recipe}/favorite/")
+        return client.delete(f"/api/recipes/{recipe}/favorite/")
+
+    def measure(self, name):
+        recorder = QueryRecorder()
+        recorder.view = name
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = getattr(self, f"call_{name}")(
+                self.random.choice(self.clients),
+                self.random.choice(self.recipes),
+            )
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise CommandError(f"{name} failed: {response.status_code}")
+        return elapsed, recorder.count
+
+    @staticmethod
+    def summary(samples):
+        latencies = [latency for latency, _ in samples]
+        queries = sum(count for _, count in samples)
+        return dict(
+            requests=len(samples),
+            queries_per_request=round(queries / len(samples), 2),
+            **{
+                f"{point}_ms": round(value, 3)
+                for point, value in percentiles(latencies).items()
+            },
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.prepare(options["users"])
+        names = self.random.choices(
+            list(MIX), list(MIX.values()), k=options["warmup"]
+            + options["requests"]
+        )
+        for name in names[:options["warmup"]]:
+            self.measure(name)
+        samples = defaultdict(list)
+        started = time.perf_counter()
+        for name in names[options["warmup"]:]:
+            samples[name].append(self.measure(name))
+        elapsed = time.perf_counter() - started
+        report = {
+            "database": connection.vendor,
+            "seed": options["seed"],
+            "requests": options["requests"],
+            "throughput_rps": round(options["requests"] / elapsed, 1),
+            "overall": self.summary(
+                [sample for values in samples.values() for sample in values]
+            ),
+            "endpoints": {
+                name: self.summary(values)
+                for name, values in sorted(samples.items())
+            },
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,119 @@
+import random
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+
+from api.cookable_index import CookableIndex, cookable_index
+from api.middleware import percentiles
+from recipes.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    """Custom command to benchmark "what can I cook" matching."""
+
+    help = (
+        "Benchmarks the ingredient inverted index on synthetic data, or on "
+        "the database against an equivalent ORM query with --database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=100_000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument("--pantry", type=int, nargs="+", default=[10, 30])
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--limit", type=int, default=6)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--database", action="store_true")
+
+    def synthetic_index(self, recipes, ingredients):
+        population = range(1, ingredients + 1)
+        weights = [1 / rank for rank in population]
+        ingredient_rows = []
+        for recipe_id in range(1, recipes + 1):
+            chosen = set(
+                self.random.choices(
+                    population, weights, k=self.random.randint(3, 15)
+                )
+            )
+            ingredient_rows.extend((recipe_id, pk) for pk in chosen)
+        tag_rows = [
+            (recipe_id, f"tag{recipe_id % 8}")
+            for recipe_id in range(1, recipes + 1)
+        ]
+        index = CookableIndex()
+        started = time.perf_counter()
+        index.load(range(1, recipes + 1), ingredient_rows, tag_rows)
+        self.stdout.write(
+            f"Built index of {recipes} recipes, {len(ingredient_rows)} rows "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return index, list(population), weights
+
+    @staticmethod
+    def orm_match(pantry, limit):
+        return list(
+            Recipe.objects.annotate(
+                total=Count("recipeingredient"),
+                have=Count(
+                    "recipeingredient",
+                    filter=Q(recipeingredient__ingredient_id__in=pantry),
+                ),
+            )
+            .filter(have__gt=0)
+            .order_by(F("total") - F("have"), "-have", "-id")
+            .values_list("id", flat=True)[:limit]
+        )
+
+    def measure(self, label, search, pantries):
+        latencies = []
+        for pantry in pantries:
+            started = time.perf_counter()
+            search(pantry)
+            latencies.append((time.perf_counter() - started) * 1000)
+        values = " ".join(
+            f"{point}={value:.2f}ms"
+            for point, value in percentiles(latencies).items()
+        )
+        self.stdout.write(f"  {label}: {values}")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        limit = options["limit"]
+        if options["database"]:
+            population = list(Ingredient.objects.values_list("id", flat=True))
+            if not Recipe.objects.exists():
+                raise CommandError("No recipes, run generate_dataset first.")
+            weights = None
+            index = cookable_index
+            started = time.perf_counter()
+            index.match([])
+            search = index.match
+            self.stdout.write(
+                f"Loaded index in {time.perf_counter() - started:.2f}s"
+            )
+        else:
+            index, population, weights = self.synthetic_index(
+                options["recipes"], options["ingredients"]
+            )
+            search = index.rank
+        for size in options["pantry"]:
+            pantries = [
+                self.random.choices(population, weights, k=size)
+                for _ in range(options["queries"])
+            ]
+            self.stdout.write(f"Pantry of {size} ingredients:")
+            self.measure(
+                "index", lambda pantry: search(pantry)[:limit], pantries
+            )
+            self.measure(
+                "index, one tag",
+                lambda pantry: search(pantry, ["tag1"])[:limit],
+                pantries,
+            )
+            if options["database"]:
+                self.measure(
+                    "orm",
+                    lambda pantry: self.orm_match(pantry, limit),
+                    pantries,
+                )
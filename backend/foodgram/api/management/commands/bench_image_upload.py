@@ -0,0 +1,61 @@
+import base64
+import io
+import os
+import time
+import tracemalloc
+
+from django.core.management import BaseCommand
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+from api.fields import StreamingBase64ImageField
+
+
+class Command(BaseCommand):
+    """Custom command to compare memory used by base64 image fields."""
+
+    help = (
+        "Benchmarks peak Python memory and time per base64 image upload: "
+        "in-memory vs streaming decode"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--width", type=int, default=3000)
+        parser.add_argument("--height", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    @staticmethod
+    def make_upload(width, height):
+        image = Image.frombytes(
+            "RGB", (width, height), os.urandom(width * height * 3)
+        )
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/jpeg;base64,{encoded}"
+
+    @staticmethod
+    def measure(field, data, repeat):
+        peaks = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            tracemalloc.start()
+            upload = field.to_internal_value(data)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            upload.close()
+        elapsed = (time.perf_counter() - started) / repeat
+        return max(peaks), elapsed
+
+    def handle(self, *args, **options):
+        data = self.make_upload(options["width"], options["height"])
+        self.stdout.write(f"Upload: {len(data) / 2 ** 20:.1f} MiB of base64")
+        for label, field in (
+            ("in-memory", Base64ImageField()),
+            ("streaming", StreamingBase64ImageField()),
+        ):
+            peak, elapsed = self.measure(field, data, options["repeat"])
+            self.stdout.write(
+                f"{label}: peak {peak / 2 ** 20:.1f} MiB, "
+                f"{elapsed * 1000:.0f} ms/upload"
+            )
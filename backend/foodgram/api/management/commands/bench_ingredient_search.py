@@ -0,0 +1,54 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """Custom command to compare database and in-memory ingredient search."""
+
+    help = "Benchmarks ingredient autocomplete: database vs prefix index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=10)
+
+    def measure(self, search, prefixes, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for prefix in prefixes:
+                search(prefix)
+        elapsed = time.perf_counter() - started
+        return elapsed / (repeat * len(prefixes)) * 1_000_000
+
+    def handle(self, *args, **options):
+        names = Ingredient.objects.values_list("name", flat=True)
+        prefixes = sorted(
+            {name[:length] for name in names for length in (1, 2, 3)}
+        )
+        if not prefixes:
+            raise CommandError("No ingredients loaded, run load_data first.")
+        limit = options["limit"]
+
+        def database_search(prefix):
+            return list(
+                Ingredient.objects.filter(name__istartswith=prefix).values(
+                    "id", "name", "measurement_unit"
+                )[:limit]
+            )
+
+        def index_search(prefix):
+            return ingredient_index.search(prefix, limit)
+
+        index_search(prefixes[0])
+        for label, search in (
+            ("database", database_search),
+            ("index", index_search),
+        ):
+            latency = self.measure(search, prefixes, options["repeat"])
+            self.stdout.write(
+                f"{label}: {latency:.1f} us/query "
+                f"({len(prefixes)} prefixes x {options['repeat']})"
+            )
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management import BaseCommand
+from django.test import Client, override_settings
+
+
+class Command(BaseCommand):
+    """Custom command to measure the overhead of PerformanceMiddleware."""
+
+    help = (
+        "Compares the best mean latency over several rounds with "
+        "PERF_MIDDLEWARE off and on"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--rounds", type=int, default=3)
+        parser.add_argument(
+            "paths", nargs="*", default=["/api/tags/", "/api/recipes/"]
+        )
+
+    @staticmethod
+    def run(path, requests):
+        client = Client()
+        client.get(path)
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get(path)
+        return (time.perf_counter() - started) / requests * 1000
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            latency = {False: float("inf"), True: float("inf")}
+            for _ in range(options["rounds"]):
+                for enabled in (False, True):
+                    with override_settings(PERF_MIDDLEWARE=enabled):
+                        latency[enabled] = min(
+                            latency[enabled],
+                            self.run(path, options["requests"]),
+                        )
+            overhead = latency[True] - latency[False]
+            self.stdout.write(
+                f"{path}: off {latency[False]:.3f} ms, "
+                f"on {latency[True]:.3f} ms, overhead {overhead:.3f} ms "
+                f"({overhead / latency[False]:.1%})"
+            )
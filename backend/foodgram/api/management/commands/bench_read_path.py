@@ -0,0 +1,67 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Custom command to compare the serializer and plain-dict read paths."""
+
+    help = (
+        "Checks that FAST_READ_PATH responses are byte-identical to the "
+        "serializer ones and reports requests/second for both"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--limit", type=int, default=6)
+
+    def endpoints(self, limit):
+        recipe = Recipe.objects.order_by("-id").first()
+        if recipe is None:
+            raise CommandError("No recipes to benchmark, add some first.")
+        return (
+            f"/api/recipes/?limit={limit}",
+            f"/api/recipes/{recipe.id}/",
+            f"/api/users/subscriptions/?limit={limit}&recipes_limit=3",
+        )
+
+    @staticmethod
+    def run(client, url, requests):
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get(url)
+        return requests / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        user = (
+            User.objects.annotate(total=Count("subscriber"))
+            .order_by("-total")
+            .first()
+        )
+        if user is None:
+            raise CommandError("No users to benchmark, add some first.")
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        failed = False
+        for url in self.endpoints(options["limit"]):
+            results = {}
+            for fast in (False, True):
+                with override_settings(FAST_READ_PATH=fast):
+                    content = client.get(url).content
+                    rps = self.run(client, url, options["requests"])
+                results[fast] = content, rps
+            identical = results[False][0] == results[True][0]
+            failed = failed or not identical
+            self.stdout.write(
+                f"{url}: serializers {results[False][1]:.0f} req/s, "
+                f"plain dicts {results[True][1]:.0f} req/s, "
+                f"output {'identical' if identical else 'DIFFERENT'}"
+            )
+        if failed:
+            raise CommandError("Read paths produced different output.")
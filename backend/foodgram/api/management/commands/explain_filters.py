@@ -0,0 +1,160 @@
+import json
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import HttpRequest, QueryDict
+
+from api.filters import RecipesFilterSet
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+PAGE_SIZE = 6
+INDEX_SCANS = ("Index Scan", "Index Only Scan")
+
+
+def problems_postgresql(queryset, threshold):
+    """Full scans and sorts in the PostgreSQL plan above threshold rows.
+
+    Sequential scans and sorts are reported from their row estimates. An
+    index scan without a condition reads the whole index unless it is the
+    first loop of an unsorted plan, which stops at the LIMIT.
+    """
+    root = json.loads(queryset[:PAGE_SIZE].explain(format="json"))[0]
+    plans = [root["Plan"]]
+    driving = root["Plan"]
+    while driving.get("Plans"):
+        driving = driving["Plans"][0]
+    problems = []
+    while plans:
+        plan = plans.pop()
+        plans.extend(plan.get("Plans", []))
+        rows = plan["Plan Rows"]
+        if rows <= threshold:
+            continue
+        if plan["Node Type"] == "Sort":
+            problems.append(f"sort of {rows} rows")
+        elif plan["Node Type"] == "Seq Scan" or (
+            plan["Node Type"] in INDEX_SCANS
+            and "Index Cond" not in plan
+            and plan is not driving
+        ):
+            table = plan["Relation Name"]
+            problems.append(f"full scan of {table} ({rows} rows)")
+    return problems
+
+
+def problems_sqlite(queryset, threshold):
+    """Full scans and sorts in the SQLite plan above threshold rows.
+
+    The first loop of the plan may scan a table or an index in the
+    requested order, which stops at the LIMIT when nothing is sorted; any
+    other scan, with or without an index, reads all of it. Sorted rows
+    are counted by running the query without its LIMIT.
+    """
+    page = queryset[:PAGE_SIZE]
+    aliases = {
+        alias: table
+        for table, alias in re.findall(r'"(\w+)" (T\d+)\b', str(page.query))
+    }
+    tables = connection.introspection.table_names()
+    details = [
+        line.split(maxsplit=3)[3] for line in page.explain().splitlines()
+    ]
+    loops = [
+        detail for detail in details if detail.startswith(("SCAN", "SEARCH"))
+    ]
+    sorted_ = any(
+        detail.startswith("USE TEMP B-TREE") and detail.endswith("ORDER BY")
+        for detail in details
+    )
+    problems = []
+    for position, detail in enumerate(loops):
+        words = detail.split()
+        table = words[2] if words[1] == "TABLE" else words[1]
+        table = aliases.get(table, table)
+        if (
+            words[0] != "SCAN"
+            or table not in tables
+            or (position == 0 and not sorted_)
+        ):
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+            rows = cursor.fetchone()[0]
+        if rows > threshold:
+            problems.append(f"full scan of {table} ({rows} rows)")
+    if sorted_:
+        rows = queryset.count()
+        if rows > threshold:
+            problems.append(f"sort of {rows} rows")
+    return problems
+
+
+class Command(BaseCommand):
+    """Custom command to check query plans of the recipe list filters."""
+
+    help = (
+        "Runs EXPLAIN on the main RecipesFilterSet combinations and fails "
+        "if a plan scans all of, or sorts, more than --threshold rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=int, default=1000)
+
+    @staticmethod
+    def filter_combinations():
+        user = (
+            User.objects.annotate(total=Count("favorites"))
+            .order_by("-total")
+            .first()
+        )
+        author = (
+            User.objects.annotate(total=Count("recipes"))
+            .order_by("-total")
+            .first()
+        )
+        tags = list(Tag.objects.values_list("slug", flat=True)[:2])
+        if not (user and author and tags):
+            raise CommandError("Not enough data: need users, recipes, tags.")
+        return user, (
+            "",
+            f"author={author.id}",
+            "&".join(f"tags={slug}" for slug in tags),
+            "is_favorited=1",
+            "is_in_shopping_cart=1",
+            f"is_favorited=1&tags={tags[0]}",
+            f"author={author.id}&tags={tags[0]}",
+            "ordering=popular",
+            f"ordering=trending&tags={tags[0]}",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == "postgresql":
+            plan_problems = problems_postgresql
+        elif connection.vendor == "sqlite":
+            plan_problems = problems_sqlite
+        else:
+            raise CommandError(f"{connection.vendor} is not supported.")
+        user, combinations = self.filter_combinations()
+        request = HttpRequest()
+        request.user = user
+        failed = False
+        for query in combinations:
+            filterset = RecipesFilterSet(
+                data=QueryDict(query),
+                queryset=Recipe.objects.order_by("-id"),
+                request=request,
+            )
+            problems = plan_problems(
+                filterset.qs.with_related(), options["threshold"]
+            )
+            failed = failed or bool(problems)
+            self.stdout.write(
+                f"{query or '(no filters)'}: "
+                + (", ".join(problems) if problems else "OK")
+            )
+        if failed:
+            raise CommandError("Full scans or sorts found in recipe filters.")
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from api.checks import default_cache_is_shared
+from api.middleware import METRICS, collect_stats
+
+
+class Command(BaseCommand):
+    """Custom command to show request statistics of PerformanceMiddleware."""
+
+    help = (
+        "Shows p50/p95/p99 wall time, database time, queries, duplicate "
+        "queries and response size per API view"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        if not default_cache_is_shared():
+            raise CommandError(
+                "Samples are kept in the default cache, which is local to "
+                "each process; set CACHE_BACKEND to a shared backend."
+            )
+        stats = collect_stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        if not stats:
+            self.stdout.write("No samples, is PERF_MIDDLEWARE enabled?")
+            return
+        for view, data in stats.items():
+            self.stdout.write(f"{view} ({data['requests']} requests)")
+            for metric in METRICS:
+                values = " ".join(
+                    f"{point}={value:.1f}"
+                    for point, value in data[metric].items()
+                )
+                self.stdout.write(f"  {metric:<10} {values}")
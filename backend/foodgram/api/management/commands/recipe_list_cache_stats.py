@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand, CommandError
+
+from api.checks import default_cache_is_shared
+from api.list_cache import get_stats
+
+
+class Command(BaseCommand):
+    """Custom command to show the anonymous recipe list cache counters."""
+
+    help = "Shows hits and misses of the anonymous recipe list cache"
+
+    def handle(self, *args, **options):
+        if not default_cache_is_shared():
+            raise CommandError(
+                "Counters are kept in the default cache, which is local to "
+                "each process; set CACHE_BACKEND to a shared backend."
+            )
+        stats = get_stats()
+        total = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / total if total else 0
+        self.stdout.write(
+            f"hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"hit ratio: {ratio:.1%}"
+        )
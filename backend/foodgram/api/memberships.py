@@ -0,0 +1,53 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingCart, Subscription
+
+CACHE_KEY = "memberships:{}"
+
+RELATIONS = {
+    Favorite: "recipe_id",
+    ShoppingCart: "recipe_id",
+    Subscription: "author_id",
+}
+
+
+def load_memberships(user):
+    """Favorited, carted recipe ids and followed author ids of the user.
+
+    Read from the primary, so a lagging replica is never cached until the
+    next write.
+    """
+    key = CACHE_KEY.format(user.id)
+    memberships = cache.get(key)
+    if memberships is None:
+        memberships = {
+            model._meta.model_name: set(
+                model.objects.using("default")
+                .filter(user=user)
+                .values_list(field, flat=True)
+            )
+            for model, field in RELATIONS.items()
+        }
+        cache.set(key, memberships, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return memberships
+
+
+def is_member(request, model, pk):
+    if not request or request.user.is_anonymous:
+        return False
+    if not hasattr(request, "memberships"):
+        request.memberships = load_memberships(request.user)
+    return pk in request.memberships[model._meta.model_name]
+
+
+def invalidate_memberships(user_id):
+    """Drop the cached memberships of a user once the change commits.
+
+    The sets are deleted rather than patched, so writes handled by other
+    workers or racing with a load are never lost; the next read reloads.
+    """
+    transaction.on_commit(partial(cache.delete, CACHE_KEY.format(user_id)))
@@ -0,0 +1,211 @@
+import logging
+import os
+import socket
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .checks import default_cache_is_shared
+from .routers import read_from_replica
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("wall_ms", "db_ms", "queries", "duplicates", "size")
+WORKERS_KEY = "perf:workers"
+WORKER_KEY = "perf:stats:{}"
+PRIMARY_COOKIE = "use_primary"
+
+
+class QueryRecorder:
+    """Database execute wrapper timing the queries of one request.
+
+    A query whose SQL was already run in the request counts as a duplicate,
+    which is what N+1 patterns look like.
+    """
+
+    def __init__(self):
+        self.view = None
+        self.count = 0
+        self.duplicates = 0
+        self.duration = 0.0
+        self.statements = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.duration += elapsed
+            if sql in self.statements:
+                self.duplicates += 1
+            else:
+                self.statements.add(sql)
+            if elapsed >= settings.PERF_SLOW_QUERY_MS:
+                logger.warning(
+                    "Slow query (%.1f ms) in %s: %s", elapsed, self.view, sql
+                )
+
+
+class Samples:
+    """Recent measurements per view of this process.
+
+    They are written to the cache under a key per process every
+    PERF_FLUSH_INTERVAL seconds, so any process can aggregate all of them.
+    """
+
+    def __init__(self):
+        self.views = defaultdict(self.new_view)
+        self.key = WORKER_KEY.format(f"{socket.gethostname()}:{os.getpid()}")
+        self.flushed = time.monotonic()
+
+    @staticmethod
+    def new_view():
+        return {
+            metric: deque(maxlen=settings.PERF_SAMPLES_PER_VIEW)
+            for metric in METRICS
+        }
+
+    def add(self, view, values):
+        samples = self.views[view]
+        for metric, value in zip(METRICS, values):
+            samples[metric].append(value)
+        if time.monotonic() - self.flushed >= settings.PERF_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        cache.set(
+            self.key,
+            {
+                view: {metric: list(values) for metric, values in data.items()}
+                for view, data in list(self.views.items())
+            },
+            settings.PERF_STATS_TIMEOUT,
+        )
+        workers = cache.get(WORKERS_KEY, set())
+        if self.key not in workers:
+            cache.set(WORKERS_KEY, workers | {self.key}, None)
+
+
+samples = Samples()
+
+
+def percentiles(values, points=(50, 95, 99)):
+    values = sorted(values)
+    last = len(values) - 1
+    return {
+        f"p{point}": values[min(last, len(values) * point // 100)]
+        for point in points
+    }
+
+
+def collect_stats():
+    """Percentiles of every metric per view, over all processes."""
+    merged = defaultdict(lambda: defaultdict(list))
+    snapshots = cache.get_many(cache.get(WORKERS_KEY, set()))
+    for snapshot in snapshots.values():
+        for view, data in snapshot.items():
+            for metric, values in data.items():
+                merged[view][metric].extend(values)
+    return {
+        view: dict(
+            requests=len(data["wall_ms"]),
+            **{metric: percentiles(data[metric]) for metric in METRICS},
+        )
+        for view, data in sorted(merged.items())
+    }
+
+
+class PerformanceMiddleware:
+    """Records wall time, database time, queries and size of API requests.
+
+    Enabled by the PERF_MIDDLEWARE setting, which needs a default cache
+    shared by all workers. Adds a Server-Timing header and logs queries
+    slower than PERF_SLOW_QUERY_MS.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERF_MIDDLEWARE:
+            raise MiddlewareNotUsed
+        if not default_cache_is_shared():
+            raise ImproperlyConfigured(
+                "PERF_MIDDLEWARE requires a shared default cache."
+            )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall = (time.perf_counter() - started) * 1000
+        response["Server-Timing"] = (
+            f"app;dur={wall:.1f}, "
+            f'db;dur={recorder.duration:.1f};desc="{recorder.count} queries"'
+        )
+        if recorder.view is not None:
+            size = 0 if response.streaming else len(response.content)
+            samples.add(
+                recorder.view,
+                (
+                    wall,
+                    recorder.duration,
+                    recorder.count,
+                    recorder.duplicates,
+                    size,
+                ),
+            )
+        return response
+
+    @staticmethod
+    def process_view(request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, "cls", view_func)
+        action = (getattr(view_func, "actions", None) or {}).get(
+            request.method.lower()
+        )
+        request.query_recorder.view = (
+            f"{view.__name__}.{action}" if action else view.__name__
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """Reads of safe-method requests go to a database replica.
+
+    Enabled when DATABASE_REPLICAS are configured. After a successful
+    write the client gets a cookie keeping its requests on the primary for
+    DATABASE_REPLICA_PIN_SECONDS, so it does not miss its own changes while
+    replicas catch up.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        read_from_replica(safe and PRIMARY_COOKIE not in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica(False)
+        if not safe and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
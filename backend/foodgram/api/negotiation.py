@@ -0,0 +1,12 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.settings import APISettings, DEFAULTS, IMPORT_STRINGS
+
+
+class QueryFormatContentNegotiation(DefaultContentNegotiation):
+    """Content negotiation leaving the format query parameter to the view."""
+
+    settings = APISettings(
+        user_settings={"URL_FORMAT_OVERRIDE": None},
+        defaults=DEFAULTS,
+        import_strings=IMPORT_STRINGS,
+    )
@@ -1,6 +1,91 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+    _positive_int,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
-class CustomPageLimitPagination(PageNumberPagination):
+class CustomCursorPagination(CursorPagination):
     page_size = 6
     page_size_query_param = "limit"
+    ordering = "-id"
+
+
+class PageLimitPagination(PageNumberPagination):
+    page_size = 6
+    page_size_query_param = "limit"
+
+
+class CustomPageLimitPagination(PageLimitPagination):
+    """Page number pagination, or keyset pagination with ?pagination=cursor.
+
+    The cursor mode skips COUNT(*) and OFFSET, so deep pages cost the same
+    as the first one; its responses have no "count" field.
+    """
+
+    mode_query_param = "pagination"
+    cursor_pagination_class = CustomCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == "cursor":
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pages of ids below the ?before= id.
+
+    Paginates a callable taking (before, limit) and returning at most limit
+    ids in descending order, for sources that are not a single queryset.
+    Responses have no "count" and no "previous" link.
+    """
+
+    page_size = 6
+    page_size_query_param = "limit"
+    before_query_param = "before"
+    invalid_before_message = "Invalid before id."
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param], strict=True
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def paginate_queryset(self, source, request, view=None):
+        self.request = request
+        before = request.query_params.get(self.before_query_param)
+        try:
+            before = _positive_int(before) if before else None
+        except ValueError:
+            raise NotFound(self.invalid_before_message)
+        page_size = self.get_page_size(request)
+        ids = source(before, page_size + 1)
+        self.next_before = ids[page_size - 1] if len(ids) > page_size else None
+        return ids[:page_size]
+
+    def get_next_link(self):
+        if self.next_before is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.before_query_param,
+            self.next_before,
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
@@ -0,0 +1,152 @@
+from collections import defaultdict
+
+from recipes.images import variant_names
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+)
+from .memberships import is_member
+
+RECIPE_FIELDS = (
+    "id",
+    "name",
+    "image",
+    "processed_image",
+    "text",
+    "cooking_time",
+    "author_id",
+    "author__email",
+    "author__username",
+    "author__first_name",
+    "author__last_name",
+)
+
+
+def image_url(name, request=None):
+    if not name:
+        return None
+    url = Recipe._meta.get_field("image").storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_variant_urls(name, processed_image, request=None):
+    """URLs of the resized copies, None until they are generated."""
+    if not name or name != processed_image:
+        return None
+    return {
+        variant: {
+            fmt: image_url(target, request) for fmt, target in names.items()
+        }
+        for variant, names in variant_names(name).items()
+    }
+
+
+def recipe_tags(recipe_ids):
+    tags = defaultdict(list)
+    rows = (
+        Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids)
+        .order_by("tag__name")
+        .values_list(
+            "recipe_id", "tag__id", "tag__name", "tag__color", "tag__slug"
+        )
+    )
+    for recipe_id, pk, name, color, slug in rows:
+        tags[recipe_id].append(
+            {"id": pk, "name": name, "color": color, "slug": slug}
+        )
+    return tags
+
+
+def recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by("pk")
+        .values_list(
+            "recipe_id",
+            "ingredient__id",
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            "amount",
+        )
+    )
+    for recipe_id, pk, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append(
+            {
+                "id": pk,
+                "name": name,
+                "measurement_unit": measurement_unit,
+                "amount": amount,
+            }
+        )
+    return ingredients
+
+
+def recipe_payloads(request, rows):
+    """Same data as RecipeReadSerializer, built from RECIPE_FIELDS rows."""
+    rows = list(rows)
+    recipe_ids = [row["id"] for row in rows]
+    tags = recipe_tags(recipe_ids)
+    ingredients = recipe_ingredients(recipe_ids)
+    return [
+        {
+            "id": row["id"],
+            "tags": tags[row["id"]],
+            "author": {
+                "email": row["author__email"],
+                "id": row["author_id"],
+                "username": row["author__username"],
+                "first_name": row["author__first_name"],
+                "last_name": row["author__last_name"],
+                "is_subscribed": is_member(
+                    request, Subscription, row["author_id"]
+                ),
+            },
+            "ingredients": ingredients[row["id"]],
+            "is_favorited": is_member(request, Favorite, row["id"]),
+            "is_in_shopping_cart": is_member(
+                request, ShoppingCart, row["id"]
+            ),
+            "name": row["name"],
+            "image": image_url(row["image"], request),
+            "image_variants": image_variant_urls(
+                row["image"], row["processed_image"], request
+            ),
+            "text": row["text"],
+            "cooking_time": row["cooking_time"],
+        }
+        for row in rows
+    ]
+
+
+def subscription_payloads(authors):
+    """Same data as SubscriptionSerializer for the subscriptions feed."""
+    return [
+        {
+            "email": author.email,
+            "id": author.id,
+            "username": author.username,
+            "first_name": author.first_name,
+            "last_name": author.last_name,
+            "is_subscribed": True,
+            "recipes": [
+                {
+                    "id": recipe.id,
+                    "name": recipe.name,
+                    "image": image_url(recipe.image.name),
+                    "image_variants": image_variant_urls(
+                        recipe.image.name, recipe.processed_image
+                    ),
+                    "cooking_time": recipe.cooking_time,
+                }
+                for recipe in author.recipes_window
+            ],
+            "recipes_count": author.recipes_count,
+        }
+        for author in authors
+    ]
@@ -0,0 +1,44 @@
+import random
+import threading
+
+from django.conf import settings
+
+state = threading.local()
+
+
+def read_from_replica(enabled):
+    """Route reads of the current thread to one replica, or to default."""
+    state.replica = (
+        random.choice(settings.DATABASE_REPLICAS)
+        if enabled and settings.DATABASE_REPLICAS
+        else None
+    )
+
+
+class PrimaryReplicaRouter:
+    """Sends reads to the replica picked for the request, if any.
+
+    Only models of DATABASE_REPLICA_APPS are read from replicas. The first
+    write in a request pins the rest of it to the primary, so it reads its
+    own writes; threads outside requests always use the primary.
+    """
+
+    @staticmethod
+    def db_for_read(model, **hints):
+        replica = getattr(state, "replica", None)
+        if replica and model._meta.app_label in settings.DATABASE_REPLICA_APPS:
+            return replica
+        return "default"
+
+    @staticmethod
+    def db_for_write(model, **hints):
+        state.replica = None
+        return "default"
+
+    @staticmethod
+    def allow_relation(obj1, obj2, **hints):
+        return True
+
+    @staticmethod
+    def allow_migrate(db, app_label, **hints):
+        return db == "default"
@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from djoser.serializers import (
     PasswordSerializer,
     UserCreateSerializer,
     UserSerializer,
 )
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
 from recipes.models import (
@@ -16,7 +18,13 @@ from recipes.models import (
     Subscription,
     Tag,
 )
+from recipes.search import update_search_documents
+from recipes.similarity import schedule_related_recipes
+from recipes.timelines import fan_out, schedule_timeline_task
 from users.models import User
+from .fields import StreamingBase64ImageField
+from .memberships import is_member
+from .payloads import image_variant_urls
 from .validators import (
     validate_cooking_time,
     validate_ingredients,
@@ -62,12 +70,9 @@ class UserProfileSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return (
-            self.context.get("request").user.is_authenticated
-            and Subscription.objects.filter(
-                user=self.context.get("request").user, author=obj
-            ).exists()
-        )
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        return is_member(self.context.get("request"), Subscription, obj.id)
 
 
 class SetPasswordSerializer(PasswordSerializer):
@@ -103,8 +108,10 @@ class SubscriptionSerializer(UserProfileSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, "recipes_window"):
+            return RecipeShortSerializer(obj.recipes_window, many=True).data
         request = self.context.get("request")
-        recipes = obj.recipes.all()
+        recipes = obj.recipes.order_by("name", "id")
         recipes_limit = request.query_params.get("recipes_limit")
         if recipes_limit:
             recipes = recipes[: int(recipes_limit)]
@@ -112,6 +119,8 @@ class SubscriptionSerializer(UserProfileSerializer):
 
     @staticmethod
     def get_recipes_count(obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -172,12 +181,23 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    """Adds URLs of the resized copies of the recipe image."""
+
+    image_variants = serializers.SerializerMethodField(read_only=True)
+
+    def get_image_variants(self, obj):
+        return image_variant_urls(
+            obj.image.name, obj.processed_image, self.context.get("request")
+        )
+
+
+class RecipeShortSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """Serializer for short representation of Recipe (add to ShoppingCart)."""
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
 
 
 class RecipeIngredientShortSerializer(serializers.ModelSerializer):
@@ -191,7 +211,7 @@ class RecipeIngredientShortSerializer(serializers.ModelSerializer):
         fields = ("id", "amount")
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """Recipe model serializer, read only."""
 
     tags = TagSerializer(many=True, read_only=True)
@@ -202,25 +222,29 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = "__all__"
+        fields = (
+            "id",
+            "tags",
+            "author",
+            "ingredients",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "name",
+            "image",
+            "image_variants",
+            "text",
+            "cooking_time",
+        )
 
     def get_ingredients(self, obj):
-        queryset = RecipeIngredient.objects.filter(recipe=obj)
+        queryset = obj.recipeingredient_set.all()
         return RecipeIngredientSerializer(queryset, many=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get("request")
-        if not request or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(user=request.user, recipe=obj).exists()
+        return is_member(self.context.get("request"), Favorite, obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get("request")
-        if not request or request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+        return is_member(self.context.get("request"), ShoppingCart, obj.id)
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -230,7 +254,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
     author = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
@@ -247,9 +271,12 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, data):
-        validate_cooking_time(cooking_time=data["cooking_time"])
-        validate_ingredients(ingredients=data["ingredients"])
-        validate_tags(tags=data["tags"])
+        if "cooking_time" in data:
+            validate_cooking_time(cooking_time=data["cooking_time"])
+        if "ingredients" in data:
+            validate_ingredients(ingredients=data["ingredients"])
+        if "tags" in data:
+            validate_tags(tags=data["tags"])
         return data
 
     @staticmethod
@@ -263,17 +290,64 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredient_list)
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe
+            )
+        }
+        amounts = {
+            ingredient["id"].id: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+
     @staticmethod
     def create_tags(tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
+        recipe.tags.add(*tags)
 
+    @staticmethod
+    def update_tags(tags, recipe):
+        current = set(recipe.tags.values_list("id", flat=True))
+        wanted = {tag.id for tag in tags}
+        if current - wanted:
+            recipe.tags.remove(*(current - wanted))
+        if wanted - current:
+            recipe.tags.add(*(wanted - current))
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
         recipe = Recipe.objects.create(**validated_data)
         self.create_tags(tags, recipe)
         self.create_ingredients(ingredients, recipe)
+        update_search_documents([recipe.id])
+        transaction.on_commit(lambda: schedule_related_recipes([recipe.id]))
+        transaction.on_commit(
+            lambda: schedule_timeline_task(fan_out, recipe.id)
+        )
         return recipe
 
     def to_representation(self, instance):
@@ -281,12 +355,24 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             self, instance, RecipeReadSerializer
         )
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_tags(validated_data.pop("tags"), instance)
-        self.create_ingredients(validated_data.pop("ingredients"), instance)
-        return super().update(instance, validated_data)
+        features_changed = False
+        if "tags" in validated_data:
+            self.update_tags(validated_data.pop("tags"), instance)
+            features_changed = True
+        if "ingredients" in validated_data:
+            self.update_ingredients(
+                validated_data.pop("ingredients"), instance
+            )
+            features_changed = True
+        recipe = super().update(instance, validated_data)
+        update_search_documents([recipe.id])
+        if features_changed:
+            transaction.on_commit(
+                lambda: schedule_related_recipes([recipe.id])
+            )
+        return recipe
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -327,3 +413,45 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         return custom_to_representation(
             self, instance.recipe, RecipeShortSerializer
         )
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Serializer for recipe ids of batch favorite and cart changes.
+
+    Validated recipes map each id to whether it is already in the list of
+    the model given in context.
+    """
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+    def validate_recipes(self, recipes):
+        model = self.context["model"]
+        members = model.objects.filter(
+            user=self.context["request"].user, recipe=OuterRef("pk")
+        )
+        found = dict(
+            Recipe.objects.filter(pk__in=recipes)
+            .annotate(member=Exists(members))
+            .values_list("pk", "member")
+        )
+        missing = sorted(set(recipes) - found.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f"Recipes not found: {missing}"
+            )
+        return found
+
+
+class CookableSerializer(serializers.Serializer):
+    """Serializer for the ingredients a user has, to find recipes."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.COOKABLE_MAX_INGREDIENTS,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
@@ -1,28 +1,188 @@
+import csv
+import json
+import os
+from collections import defaultdict
+
 from django.conf import settings
-from django.db.models import Sum
-from django.http import HttpResponse
-from rest_framework.decorators import action
-
-
-@action(detail=False)
-def generate_shopping_list(user):
-    text = "Shopping list:\n\n"
-    ingredient_name = "recipe__ingredients__name"
-    ingredient_unit = "recipe__ingredients__measurement_unit"
-    ingredient_qty = "recipe__recipeingredient__amount"
-    ingredient_qty_sum = "recipe__recipeingredient__amount__sum"
-    shopping_cart = (
-        user.shopping_cart.select_related("recipe")
-            .values(ingredient_name, ingredient_unit)
-            .annotate(Sum(ingredient_qty))
-            .order_by(ingredient_name)
+from django.db import connection, transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import serializers
+
+from recipes.models import Recipe, RecipeIngredient
+from recipes.signals import adjust_recipe_counters
+from .memberships import invalidate_memberships
+
+SHOPPING_LIST_CONTENT_TYPES = {
+    "txt": "text/plain",
+    "csv": "text/csv",
+    "json": "application/json",
+}
+
+
+class Echo:
+    """File-like object that returns what is written, for csv.writer."""
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+def get_shopping_list(user):
+    """Aggregate amounts of all ingredients in the user's shopping cart."""
+    return (
+        RecipeIngredient.objects.filter(
+            recipe__is_in_shopping_cart__user=user
+        )
+        .values(
+            name=F("ingredient__name"),
+            measurement_unit=F("ingredient__measurement_unit"),
+        )
+        .annotate(total_amount=Sum("amount"))
+        .order_by("name", "measurement_unit")
+        .iterator()
+    )
+
+
+def shopping_list_txt(items):
+    yield "Shopping list:\n\n"
+    for item in items:
+        yield (
+            f"{item['name']} ({item['measurement_unit']})"
+            f" — {item['total_amount']}\n"
+        )
+
+
+def shopping_list_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("name", "measurement_unit", "amount"))
+    for item in items:
+        yield writer.writerow(
+            (item["name"], item["measurement_unit"], item["total_amount"])
+        )
+
+
+def shopping_list_json(items):
+    yield "["
+    separator = ""
+    for item in items:
+        yield separator + json.dumps(
+            {
+                "name": item["name"],
+                "measurement_unit": item["measurement_unit"],
+                "amount": item["total_amount"],
+            },
+            ensure_ascii=False,
+        )
+        separator = ", "
+    yield "]"
+
+
+SHOPPING_LIST_WRITERS = {
+    "txt": shopping_list_txt,
+    "csv": shopping_list_csv,
+    "json": shopping_list_json,
+}
+
+
+def generate_shopping_list(user, file_format="txt"):
+    if file_format not in SHOPPING_LIST_WRITERS:
+        raise serializers.ValidationError(
+            {
+                "format": "Choose one of: "
+                + ", ".join(SHOPPING_LIST_WRITERS)
+            }
+        )
+    writer = SHOPPING_LIST_WRITERS[file_format]
+    response = StreamingHttpResponse(
+        writer(get_shopping_list(user)),
+        content_type=SHOPPING_LIST_CONTENT_TYPES[file_format],
+    )
+    name, _ = os.path.splitext(settings.FILENAME_FOR_SERVICES)
+    response["Content-Disposition"] = (
+        f"attachment; filename={name}.{file_format}"
     )
-    for item in shopping_cart:
-        text += (
-            f"{item[ingredient_name]} ({item[ingredient_unit]})"
-            f" — {item[ingredient_qty_sum]}\n"
-        )
-    response = HttpResponse(text, content_type="text/plain")
-    filename = settings.FILENAME_FOR_SERVICES
-    response["Content-Disposition"] = f"attachment; filename={filename}"
     return response
+
+
+def attach_recipes_window(authors, recipes_limit=None):
+    """Load the first recipes_limit recipes of every author in one query."""
+    authors = list(authors)
+    author_ids = [author.id for author in authors]
+    recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        "author_id", "name", "id"
+    )
+    if recipes_limit is not None and connection.features.supports_over_clause:
+        ranked = recipes.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F("author_id")],
+                order_by=[F("name").asc(), F("id").asc()],
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f"SELECT * FROM ({sql}) ranked WHERE ranked.row_number <= %s "
+            f"ORDER BY ranked.author_id, ranked.name, ranked.id",
+            (*params, recipes_limit),
+        )
+        recipes_limit = None
+    recipes_by_author = defaultdict(list)
+    for recipe in recipes:
+        author_recipes = recipes_by_author[recipe.author_id]
+        if recipes_limit is None or len(author_recipes) < recipes_limit:
+            author_recipes.append(recipe)
+    for author in authors:
+        author.recipes_window = recipes_by_author[author.id]
+    return authors
+
+
+def changed_recipes(cursor, model, user, sign):
+    """Count the recipe ids a write returned and drop cached memberships."""
+    recipe_ids = [pk for pk, in cursor.fetchall()]
+    if recipe_ids:
+        adjust_recipe_counters(model, recipe_ids, sign)
+        invalidate_memberships(user.id)
+
+
+def add_recipes(user, model, recipe_ids):
+    """Add recipes to favorites or shopping cart of user in one insert.
+
+    Bulk writes send no signals, so counters and scores of the recipes
+    actually inserted are updated and the cached memberships invalidated
+    here. Recipes added concurrently by another request are not counted
+    twice.
+    """
+    if not recipe_ids:
+        return
+    created = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = ", ".join(["(%s, %s, %s)"] * len(recipe_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {model._meta.db_table} "
+            f"(user_id, recipe_id, created) VALUES {rows} "
+            f"ON CONFLICT DO NOTHING RETURNING recipe_id",
+            [
+                value
+                for pk in recipe_ids
+                for value in (user.id, pk, created)
+            ],
+        )
+        changed_recipes(cursor, model, user, 1)
+
+
+def remove_recipes(user, model, recipe_ids):
+    """Remove recipes from favorites or shopping cart in one delete."""
+    if not recipe_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(recipe_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {model._meta.db_table} "
+            f"WHERE user_id = %s AND recipe_id IN ({placeholders}) "
+            f"RETURNING recipe_id",
+            [user.id, *recipe_ids],
+        )
+        changed_recipes(cursor, model, user, -1)
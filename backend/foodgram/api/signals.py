@@ -0,0 +1,104 @@
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    Subscription,
+    Tag,
+)
+from .conditional import bump_version
+from .cookable_index import cookable_index
+from .ingredient_index import ingredient_index
+from .list_cache import invalidate_recipe_lists
+from .memberships import invalidate_memberships
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_version(**kwargs):
+    transaction.on_commit(partial(bump_version, "tags"))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def invalidate_recipe_pages(instance, **kwargs):
+    transaction.on_commit(
+        partial(
+            invalidate_recipe_lists,
+            instance.author_id,
+            list(instance.tags.values_list("slug", flat=True)),
+        )
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tag_pages(instance, action, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        tags = Tag.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        tags = instance.tags.all()
+    else:
+        return
+    transaction.on_commit(
+        partial(
+            invalidate_recipe_lists,
+            instance.author_id,
+            list(tags.values_list("slug", flat=True)),
+        )
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_cookable_index(**kwargs):
+    transaction.on_commit(cookable_index.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_user_memberships(instance, **kwargs):
+    invalidate_memberships(instance.user_id)
+
+
+@receiver(request_started)
+def check_database_connections(**kwargs):
+    """Drop persistent connections the database closed while they idled.
+
+    Each open connection is pinged at most once per
+    DATABASE_HEALTH_CHECK_INTERVAL seconds, so busy workers do not pay a
+    round trip per request and alias. A connection that fails in between
+    is closed by Django when the request that hit the error finishes.
+    """
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        checked = getattr(connection, "health_checked_at", None)
+        if (
+            checked is not None
+            and now - checked < settings.DATABASE_HEALTH_CHECK_INTERVAL
+        ):
+            continue
+        connection.health_checked_at = now
+        if not connection.is_usable():
+            connection.close()
@@ -0,0 +1,1276 @@
+import base64
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.checks import run_checks
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from recipes.images import process_recipe_image
+from recipes.management.commands.load_data import DEFAULT_PATH
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeScore,
+    ShoppingCart,
+    Subscription,
+    Tag,
+    TimelineEntry,
+)
+from recipes.search import update_search_documents
+from recipes.similarity import related_recipe_ids, update_related_recipes
+from recipes.storage import image_storage
+from users.models import User
+from .cookable_index import CookableIndex, cookable_index
+from .fields import StreamingBase64ImageField
+from .list_cache import get_stats, stats
+from .middleware import PRIMARY_COOKIE
+from .routers import PrimaryReplicaRouter, read_from_replica
+from .services import add_recipes, remove_recipes
+
+TEST_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-default",
+    },
+    "recipe_list": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-recipe-list",
+    },
+}
+
+LIMITS = (1, 6, 20)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeDataTestCase(APITestCase):
+    """Users with recipes, tags, ingredients, favorites and subscriptions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f"user{index}",
+                email=f"user{index}@example.com",
+                password="password",
+                first_name="First",
+                last_name="Last",
+            )
+            for index in range(4)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f"Tag {index}", color=f"#00000{index}", slug=f"tag{index}"
+            )
+            for index in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"Ingredient {index}", measurement_unit="g"
+            )
+            for index in range(10)
+        ]
+        cls.recipes = []
+        for index in range(30):
+            recipe = Recipe.objects.create(
+                author=cls.users[index % len(cls.users)],
+                name=f"Recipe {index}",
+                image="recipes/images/recipe.png",
+                text="Text",
+                cooking_time=10,
+            )
+            recipe.tags.add(*cls.tags[: index % 3 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(index + shift) % 10],
+                    amount=shift + 1,
+                )
+                for shift in range(index % 4 + 1)
+            )
+            cls.recipes.append(recipe)
+        cls.user = cls.users[0]
+        for recipe in cls.recipes[::3]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::4]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.users[1:3]:
+            Subscription.objects.create(user=cls.user, author=author)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.clear_caches()
+
+    @staticmethod
+    def clear_caches():
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+
+class RecipeQueryCountTests(RecipeDataTestCase):
+    """Recipe list and detail run a fixed number of queries at any limit.
+
+    Authenticated requests read the favorite, cart and subscription sets
+    of the user once, the first time they are not cached.
+    """
+
+    def assert_list_queries(self, count):
+        for limit in LIMITS:
+            with self.subTest(limit=limit):
+                self.clear_caches()
+                with self.assertNumQueries(count):
+                    response = self.client.get(f"/api/recipes/?limit={limit}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), limit)
+
+    def assert_detail_queries(self, count):
+        for recipe in self.recipes[:3]:
+            with self.subTest(recipe=recipe.id):
+                self.clear_caches()
+                with self.assertNumQueries(count):
+                    response = self.client.get(f"/api/recipes/{recipe.id}/")
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_list(self):
+        self.assert_list_queries(5)
+
+    def test_authenticated_list(self):
+        self.authenticate()
+        self.assert_list_queries(9)
+
+    def test_anonymous_detail(self):
+        self.assert_detail_queries(6)
+
+    def test_authenticated_detail(self):
+        self.authenticate()
+        self.assert_detail_queries(9)
+
+    def test_cursor_list(self):
+        self.authenticate()
+        for limit in LIMITS:
+            with self.subTest(limit=limit):
+                self.clear_caches()
+                with self.assertNumQueries(8):
+                    response = self.client.get(
+                        f"/api/recipes/?pagination=cursor&limit={limit}"
+                    )
+                self.assertEqual(len(response.data["results"]), limit)
+
+    def test_flags(self):
+        self.authenticate()
+        positions = {
+            recipe.id: index for index, recipe in enumerate(self.recipes)
+        }
+        response = self.client.get("/api/recipes/?limit=30")
+        for recipe in response.data["results"]:
+            index = positions[recipe["id"]]
+            self.assertEqual(recipe["is_favorited"], index % 3 == 0)
+            self.assertEqual(recipe["is_in_shopping_cart"], index % 4 == 0)
+            self.assertEqual(
+                recipe["author"]["is_subscribed"],
+                index % len(self.users) in (1, 2),
+            )
+
+
+class ReadPathTests(RecipeDataTestCase):
+    """FAST_READ_PATH responses are byte-identical to the serializer ones."""
+
+    def urls(self):
+        return (
+            "/api/recipes/?limit=6",
+            "/api/recipes/?limit=6&tags=tag1&ordering=popular",
+            f"/api/recipes/{self.recipes[5].id}/",
+            "/api/users/subscriptions/?limit=6&recipes_limit=3",
+        )
+
+    def content(self, url, fast):
+        self.clear_caches()
+        with override_settings(FAST_READ_PATH=fast):
+            response = self.client.get(url)
+        return response.status_code, response.content
+
+    def assert_identical(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.content(url, False), self.content(url, True)
+                )
+
+    def test_anonymous(self):
+        self.assert_identical()
+
+    def test_authenticated(self):
+        self.authenticate()
+        self.assert_identical()
+
+
+class BatchWriteTests(RecipeDataTestCase):
+    """Batch writes count only the rows they actually change."""
+
+    def favorites_count(self, recipe):
+        return Recipe.objects.get(pk=recipe.pk).favorites_count
+
+    def test_repeated_writes(self):
+        user, recipe, other = self.users[1], self.recipes[1], self.recipes[2]
+        add_recipes(user, Favorite, [recipe.id])
+        add_recipes(user, Favorite, [recipe.id, other.id])
+        self.assertEqual(self.favorites_count(recipe), 1)
+        self.assertEqual(self.favorites_count(other), 1)
+        remove_recipes(user, Favorite, [recipe.id])
+        remove_recipes(user, Favorite, [recipe.id, other.id])
+        self.assertEqual(self.favorites_count(recipe), 0)
+        self.assertEqual(self.favorites_count(other), 0)
+        self.assertFalse(Favorite.objects.filter(user=user).exists())
+
+
+class CookableTests(RecipeDataTestCase):
+    def test_uniform_ingredient_counts(self):
+        index = CookableIndex()
+        index.load(
+            [1, 2, 3],
+            [(1, 10), (1, 11), (2, 10), (2, 12), (3, 11), (3, 12)],
+            [],
+        )
+        self.assertEqual(index.rank([10, 11])[:3], [(1, 0), (3, 1), (2, 1)])
+
+    def test_cursor_mode(self):
+        self.authenticate()
+        cookable_index.rebuild()
+        response = self.client.post(
+            "/api/recipes/cookable/?pagination=cursor&limit=5",
+            {"ingredients": [self.ingredients[0].id]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIn("count", response.data)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscriptionsTests(APITestCase):
+    """Subscriptions of 500 followed authors with 50 recipes each."""
+
+    authors_count = 500
+    recipes_per_author = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username="reader", email="reader@example.com"
+        )
+        cls.authors = [
+            User.objects.create(
+                username=f"author{index}", email=f"author{index}@example.com"
+            )
+            for index in range(cls.authors_count)
+        ]
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.user, author=author)
+            for author in cls.authors
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f"Recipe {index:02}",
+                image="recipes/images/recipe.png",
+                text="Text",
+                cooking_time=10,
+            )
+            for author in cls.authors
+            for index in reversed(range(cls.recipes_per_author))
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_query_count(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                "/api/users/subscriptions/?limit=500&recipes_limit=3"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), self.authors_count)
+        for author in response.data["results"]:
+            self.assertEqual(
+                [recipe["name"] for recipe in author["recipes"]],
+                ["Recipe 00", "Recipe 01", "Recipe 02"],
+            )
+
+    def test_invalid_recipes_limit(self):
+        for limit in ("abc", "0", "-1"):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    f"/api/users/subscriptions/?recipes_limit={limit}"
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class RecipeUpdateTests(RecipeDataTestCase):
+    """Updates touch only the ingredient and tag rows that changed."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[3]
+        token = Token.objects.create(user=self.recipe.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.url = f"/api/recipes/{self.recipe.id}/"
+
+    def rows(self):
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in RecipeIngredient.objects.filter(recipe=self.recipe)
+        }
+
+    @staticmethod
+    def writes(queries, table):
+        return [
+            query["sql"]
+            for query in queries
+            if table in query["sql"]
+            and query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+
+    def test_name_only(self):
+        rows = self.rows()
+        tags = set(self.recipe.tags.all())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                self.url, {"name": "Renamed"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rows(), rows)
+        self.assertEqual(set(self.recipe.tags.all()), tags)
+        self.assertEqual(self.writes(queries, "recipeingredient"), [])
+        self.assertEqual(self.writes(queries, "recipe_tags"), [])
+
+    def test_partial_ingredient_change(self):
+        rows = self.rows()
+        kept, changed, removed, *rest = sorted(rows)
+        added = next(
+            ingredient.id
+            for ingredient in self.ingredients
+            if ingredient.id not in rows
+        )
+        ingredients = [
+            {"id": kept, "amount": rows[kept][1]},
+            {"id": changed, "amount": rows[changed][1] + 10},
+            {"id": added, "amount": 7},
+        ] + [{"id": pk, "amount": rows[pk][1]} for pk in rest]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                self.url, {"ingredients": ingredients}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        new_rows = self.rows()
+        self.assertNotIn(removed, new_rows)
+        for pk in [kept, *rest]:
+            self.assertEqual(new_rows[pk], rows[pk])
+        self.assertEqual(
+            new_rows[changed], (rows[changed][0], rows[changed][1] + 10)
+        )
+        self.assertEqual(new_rows[added][1], 7)
+        writes = self.writes(queries, "recipeingredient")
+        self.assertEqual(
+            [sql.split()[0] for sql in writes], ["DELETE", "UPDATE", "INSERT"]
+        )
+
+    @override_settings(
+        RECIPE_IMAGE_MAX_BYTES=1024, RECIPE_IMAGE_MAX_PIXELS=100
+    )
+    def test_image_limits(self):
+        images = {
+            "too_large": Image.frombytes("L", (64, 64), os.urandom(64 * 64)),
+            "too_many_pixels": Image.new("L", (20, 20)),
+        }
+        for error, image in images.items():
+            buffer = BytesIO()
+            image.save(buffer, format="PNG")
+            data = base64.b64encode(buffer.getvalue()).decode()
+            with self.subTest(error=error):
+                response = self.client.patch(
+                    self.url,
+                    {"image": f"data:image/png;base64,{data}"},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("image", response.data)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, "recipes/images/recipe.png")
+
+
+class ShoppingListTests(RecipeDataTestCase):
+    """The shopping list sums each ingredient over the carted recipes."""
+
+    url = "/api/recipes/download_shopping_cart/"
+    expected = [
+        ("Ingredient 0", "g", 2),
+        ("Ingredient 2", "g", 1),
+        ("Ingredient 4", "g", 2),
+        ("Ingredient 6", "g", 1),
+        ("Ingredient 8", "g", 2),
+    ]
+
+    def download(self, file_format):
+        self.authenticate()
+        response = self.client.get(self.url, {"format": file_format})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_txt(self):
+        lines = self.download("txt").splitlines()
+        self.assertEqual(lines[0], "Shopping list:")
+        self.assertEqual(
+            lines[2:],
+            [
+                f"{name} ({unit}) — {amount}"
+                for name, unit, amount in self.expected
+            ],
+        )
+
+    def test_csv(self):
+        rows = list(csv.reader(self.download("csv").splitlines()))
+        self.assertEqual(rows[0], ["name", "measurement_unit", "amount"])
+        self.assertEqual(
+            rows[1:],
+            [
+                [name, unit, str(amount)]
+                for name, unit, amount in self.expected
+            ],
+        )
+
+    def test_json(self):
+        self.assertEqual(
+            json.loads(self.download("json")),
+            [
+                {"name": name, "measurement_unit": unit, "amount": amount}
+                for name, unit, amount in self.expected
+            ],
+        )
+
+    def test_unsupported_format(self):
+        self.authenticate()
+        response = self.client.get(self.url, {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeSearchTests(APITestCase):
+    """Full-text search over recipe names, ingredients and texts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username="author", email="author@example.com"
+        )
+        tomato = Ingredient.objects.create(name="Tomato", measurement_unit="g")
+        cls.recipes = {}
+        for name, text, ingredients in (
+            ("Tomato soup", "Hot soup", [tomato]),
+            ("Green salad", "Add a tomato or two", []),
+            ("Omelette", "Eggs", []),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=name,
+                image="recipes/images/recipe.png",
+                text=text,
+                cooking_time=10,
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=item, amount=1)
+                for item in ingredients
+            )
+            cls.recipes[name] = recipe
+        update_search_documents([recipe.id for recipe in cls.recipes.values()])
+        cls.token = Token.objects.create(user=cls.author)
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def search(self, text):
+        response = self.client.get("/api/recipes/", {"search": text})
+        self.assertEqual(response.status_code, 200)
+        return [recipe["name"] for recipe in response.data["results"]]
+
+    def test_ranked_match(self):
+        self.assertEqual(self.search("tomato"), ["Tomato soup", "Green salad"])
+
+    def test_edit_updates_document(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        recipe = self.recipes["Omelette"]
+        response = self.client.patch(
+            f"/api/recipes/{recipe.id}/",
+            {"name": "Pumpkin pie", "text": "Pumpkin"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search("pumpkin"), ["Pumpkin pie"])
+        self.assertEqual(self.search("omelette"), [])
+
+    def test_malformed_query(self):
+        for text in ('"tomato', "tomato AND", "*:(", "-", 'NEAR("a" OR'):
+            with self.subTest(text=text):
+                self.search(text)
+
+
+class IngredientSearchTests(RecipeDataTestCase):
+    def test_prefix_matches_first(self):
+        Ingredient.objects.create(name="Salt ingredient", measurement_unit="g")
+        response = self.client.get("/api/ingredients/?name=ingredient")
+        names = [item["name"] for item in response.data]
+        self.assertEqual(
+            names[:10], [f"Ingredient {index}" for index in range(10)]
+        )
+        self.assertEqual(names[10:], ["Salt ingredient"])
+
+    def test_limit(self):
+        response = self.client.get("/api/ingredients/?limit=2")
+        self.assertEqual(len(response.data), 2)
+
+    def test_invalid_limit(self):
+        for limit in ("abc", "0", "-1"):
+            with self.subTest(limit=limit):
+                response = self.client.get(f"/api/ingredients/?limit={limit}")
+                self.assertEqual(response.status_code, 400)
+
+
+class RecipeOrderingTests(RecipeDataTestCase):
+    def test_popular(self):
+        expected = list(
+            RecipeScore.objects.order_by("-popularity", "-recipe_id")
+            .values_list("recipe_id", flat=True)[:10]
+        )
+        response = self.client.get("/api/recipes/?ordering=popular&limit=10")
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]], expected
+        )
+
+    def test_trending_with_tags(self):
+        tagged = set(self.tags[2].recipes.values_list("id", flat=True))
+        RecipeScore.objects.filter(recipe_id__in=tagged).update(
+            trending=F("recipe_id") % 5
+        )
+        expected = [
+            pk
+            for pk in RecipeScore.objects.order_by(
+                "-trending", "-recipe_id"
+            ).values_list("recipe_id", flat=True)
+            if pk in tagged
+        ]
+        response = self.client.get(
+            "/api/recipes/?ordering=trending&tags=tag2&limit=30"
+        )
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]], expected
+        )
+
+
+class QueryPlanTests(TestCase):
+    """Recipe filter plans neither scan nor sort more than a page needs."""
+
+    threshold = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create(
+                username=f"user{index}", email=f"user{index}@example.com"
+            )
+            for index in range(20)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f"Tag {index}", color=f"#00000{index}", slug=f"tag{index}"
+            )
+            for index in range(3)
+        ]
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[index % len(users)],
+                name=f"Recipe {index}",
+                image="recipes/images/recipe.png",
+                text="Text",
+                cooking_time=10,
+            )
+            for index in range(cls.threshold * 2)
+        )
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=pk, tag=tags[pk % len(tags)])
+            for pk in recipe_ids
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=users[0], recipe_id=pk) for pk in recipe_ids[:50]
+            )
+        call_command("refresh_recipe_scores", "--full", stdout=StringIO())
+
+    def test_filter_plans(self):
+        output = StringIO()
+        try:
+            call_command(
+                "explain_filters", threshold=self.threshold, stdout=output
+            )
+        except CommandError as error:
+            self.fail(f"{error}\n{output.getvalue()}")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MembershipCacheTests(APITransactionTestCase):
+    """Cached flags follow writes, which invalidate them after commit."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.user, self.author = (
+            User.objects.create_user(
+                username=username, email=f"{username}@example.com"
+            )
+            for username in ("user", "author")
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="Recipe",
+            image="recipes/images/recipe.png",
+            processed_image="recipes/images/recipe.png",
+            text="Text",
+            cooking_time=10,
+        )
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def flags(self):
+        data = self.client.get(f"/api/recipes/{self.recipe.id}/").data
+        return (
+            data["is_favorited"],
+            data["is_in_shopping_cart"],
+            data["author"]["is_subscribed"],
+        )
+
+    def test_single_writes(self):
+        recipe_url = f"/api/recipes/{self.recipe.id}"
+        subscribe_url = f"/api/users/{self.author.id}/subscribe/"
+        self.assertEqual(self.flags(), (False, False, False))
+        self.client.post(f"{recipe_url}/favorite/")
+        self.client.post(f"{recipe_url}/shopping_cart/")
+        self.client.post(subscribe_url)
+        self.assertEqual(self.flags(), (True, True, True))
+        self.client.delete(f"{recipe_url}/favorite/")
+        self.client.delete(f"{recipe_url}/shopping_cart/")
+        self.client.delete(subscribe_url)
+        self.assertEqual(self.flags(), (False, False, False))
+
+    def test_batch_writes(self):
+        self.assertEqual(self.flags(), (False, False, False))
+        data = {"recipes": [self.recipe.id]}
+        self.client.post("/api/recipes/favorite/batch/", data, format="json")
+        self.assertEqual(self.flags(), (True, False, False))
+        self.client.delete(
+            "/api/recipes/favorite/batch/", data, format="json"
+        )
+        self.assertEqual(self.flags(), (False, False, False))
+
+    def test_write_outside_api(self):
+        self.assertEqual(self.flags(), (False, False, False))
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(self.flags(), (True, False, False))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalGetTests(APITransactionTestCase):
+    """Table ETags change once a write to the table commits."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        Tag.objects.create(name="Tag", color="#000000", slug="tag")
+
+    def test_tags_etag(self):
+        etag = self.client.get("/api/tags/")["ETag"]
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name="Other", color="#000001", slug="other")
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeListCacheTests(APITransactionTestCase):
+    """Cached anonymous list pages expire once a recipe change commits."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.author = User.objects.create(
+            username="author", email="author@example.com"
+        )
+        self.tag = Tag.objects.create(name="Tag", color="#000000", slug="tag")
+
+    def create_recipe(self, name):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name=name,
+            image="recipes/images/recipe.png",
+            processed_image="recipes/images/recipe.png",
+            text="Text",
+            cooking_time=10,
+        )
+        recipe.tags.add(self.tag)
+        return recipe
+
+    def results(self, query=""):
+        return self.client.get(f"/api/recipes/?{query}").json()["results"]
+
+    def names(self, query=""):
+        return [recipe["name"] for recipe in self.results(query)]
+
+    def test_pages_expire(self):
+        self.create_recipe("First")
+        for query in ("", "tags=tag", f"author={self.author.id}"):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), ["First"])
+        recipe = self.create_recipe("Second")
+        for query in ("", "tags=tag", f"author={self.author.id}"):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), ["Second", "First"])
+        recipe.delete()
+        for query in ("", "tags=tag", f"author={self.author.id}"):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), ["First"])
+
+    def test_ranked_pages_expire(self):
+        first = self.create_recipe("First")
+        self.create_recipe("Second")
+        self.assertEqual(self.names("ordering=popular"), ["Second", "First"])
+        Favorite.objects.create(user=self.author, recipe=first)
+        self.assertEqual(self.names("ordering=popular"), ["First", "Second"])
+
+    @override_settings(PERF_FLUSH_INTERVAL=0)
+    def test_stats(self):
+        self.create_recipe("First")
+        stats.flush()
+        before = get_stats()
+        self.names()
+        self.names()
+        after = get_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_processed_image_expires_pages(self):
+        recipe = self.create_recipe("First")
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                buffer = BytesIO()
+                Image.new("RGB", (8, 8)).save(buffer, format="PNG")
+                name = recipe.image.storage.save(
+                    "images/new.png", ContentFile(buffer.getvalue())
+                )
+                Recipe.objects.filter(pk=recipe.pk).update(image=name)
+                for query in ("", "tags=tag"):
+                    with self.subTest(query=query):
+                        self.assertIsNone(
+                            self.results(query)[0]["image_variants"]
+                        )
+                process_recipe_image(recipe.pk)
+                for query in ("", "tags=tag"):
+                    with self.subTest(query=query):
+                        self.assertIsNotNone(
+                            self.results(query)[0]["image_variants"]
+                        )
+        updated_at = Recipe.objects.get(pk=recipe.pk).updated_at
+        self.assertGreater(updated_at, recipe.updated_at)
+
+
+class PerfReportTests(TestCase):
+    """Samples of PerformanceMiddleware reach perf_report via the cache."""
+
+    def test_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            shared = dict(
+                TEST_CACHES,
+                default={
+                    "BACKEND": (
+                        "django.core.cache.backends.filebased.FileBasedCache"
+                    ),
+                    "LOCATION": location,
+                },
+            )
+            with override_settings(
+                CACHES=shared, PERF_MIDDLEWARE=True, PERF_FLUSH_INTERVAL=0
+            ):
+                response = Client().get("/api/tags/")
+                self.assertIn("Server-Timing", response)
+                output = StringIO()
+                call_command("perf_report", json=True, stdout=output)
+        stats = json.loads(output.getvalue())
+        self.assertIn("TagsViewSet.list", stats)
+
+    @override_settings(CACHES=TEST_CACHES, PERF_MIDDLEWARE=True)
+    def test_process_local_cache(self):
+        errors = [error.id for error in run_checks()]
+        self.assertIn("api.E001", errors)
+        with self.assertRaises(CommandError):
+            call_command("perf_report", stdout=StringIO())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LoadDataTests(TestCase):
+    """load_data streams CSV and JSON, skipping existing and repeated rows."""
+
+    ROWS = [
+        ("salt", "g"),
+        ("milk, 3.2%", "ml"),
+        ("salt", "g"),
+        ("egg", "pcs"),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, "ingredients.csv")
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            csv.writer(file).writerows(rows)
+        return path
+
+    def write_json_gz(self, rows):
+        path = os.path.join(self.directory, "ingredients.json.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            json.dump(
+                [
+                    {"name": name, "measurement_unit": unit}
+                    for name, unit in rows
+                ],
+                file,
+            )
+        return path
+
+    @staticmethod
+    def load(*args, **options):
+        output = StringIO()
+        call_command("load_data", *args, stdout=output, **options)
+        return output.getvalue()
+
+    def ingredients(self):
+        return set(Ingredient.objects.values_list("name", "measurement_unit"))
+
+    def test_csv(self):
+        output = self.load(self.write_csv(self.ROWS))
+        self.assertEqual(self.ingredients(), set(self.ROWS))
+        self.assertIn("Read 4 rows, created 3 ingredients, skipped 1", output)
+
+    def test_gzipped_json(self):
+        output = self.load(self.write_json_gz(self.ROWS), batch_size=2)
+        self.assertEqual(self.ingredients(), set(self.ROWS))
+        self.assertIn("Read 4 rows, created 3 ingredients, skipped 1", output)
+
+    def test_rerun(self):
+        self.load(self.write_csv(self.ROWS))
+        output = self.load(self.write_json_gz(self.ROWS + [("flour", "g")]))
+        self.assertEqual(self.ingredients(), {*self.ROWS, ("flour", "g")})
+        self.assertIn("Read 5 rows, created 1 ingredients, skipped 4", output)
+
+    def test_shipped_data(self):
+        output = self.load()
+        self.assertEqual(Ingredient.objects.count(), 2186)
+        self.assertIn("created 2186 ingredients, skipped 2", output)
+        output = self.load(DEFAULT_PATH.replace(".csv", ".json"))
+        self.assertEqual(Ingredient.objects.count(), 2186)
+        self.assertIn("created 0 ingredients, skipped 2188", output)
+
+    def test_malformed_file(self):
+        with self.assertRaises(CommandError):
+            self.load(self.write_csv([("salt", "g", "extra")]))
+        self.assertFalse(Ingredient.objects.exists())
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    RELATED_RECIPES_ASYNC=False,
+    RECIPE_IMAGE_ASYNC=False,
+    FEED_ASYNC=False,
+)
+class RelatedRecipesTests(APITransactionTestCase):
+    """Related recipes of a new recipe are computed after it commits."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com"
+        )
+        self.tag = Tag.objects.create(name="Tag", color="#000000", slug="tag")
+        self.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit="g")
+            for name in ("Flour", "Milk")
+        ]
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="Pancakes",
+            image="recipes/images/recipe.png",
+            processed_image="recipes/images/recipe.png",
+            text="Text",
+            cooking_time=10,
+        )
+        self.recipe.tags.add(self.tag)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=self.recipe, ingredient=ingredient, amount=1
+            )
+            for ingredient in self.ingredients
+        )
+        update_related_recipes([self.recipe.id])
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def test_create(self):
+        buffer = BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, format="PNG")
+        image = base64.b64encode(buffer.getvalue()).decode()
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                response = self.client.post(
+                    "/api/recipes/",
+                    {
+                        "name": "Crepes",
+                        "text": "Text",
+                        "cooking_time": 5,
+                        "image": f"data:image/png;base64,{image}",
+                        "tags": [self.tag.id],
+                        "ingredients": [
+                            {"id": ingredient.id, "amount": 2}
+                            for ingredient in self.ingredients
+                        ],
+                    },
+                    format="json",
+                )
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe_id = response.data["id"]
+        self.assertEqual(related_recipe_ids(recipe_id), [self.recipe.id])
+        self.assertEqual(related_recipe_ids(self.recipe.id), [recipe_id])
+
+
+class OrphanImageTests(TestCase):
+    """collect_orphan_images keeps files an upload has just reused."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def save_old(name):
+        image_storage.save(name, ContentFile(b"image"))
+        old = time.time() - 2 * 3600
+        os.utime(image_storage.path(name), (old, old))
+
+    def collect(self):
+        call_command("collect_orphan_images", stdout=StringIO())
+
+    def test_old_orphan_deleted(self):
+        self.save_old("images/aa/orphan.png")
+        self.collect()
+        self.assertFalse(image_storage.exists("images/aa/orphan.png"))
+
+    def test_reused_file_kept(self):
+        self.save_old("images/aa/reused.png")
+        image_storage.save("images/aa/reused.png", ContentFile(b"image"))
+        self.collect()
+        self.assertTrue(image_storage.exists("images/aa/reused.png"))
+
+
+class ImageFieldTests(SimpleTestCase):
+    """Uploaded images are checked, then stored as a clean, capped copy."""
+
+    @staticmethod
+    def encoded(image, fmt="JPEG", **params):
+        buffer = BytesIO()
+        image.save(buffer, format=fmt, **params)
+        data = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/{fmt.lower()};base64,{data}"
+
+    @staticmethod
+    def stored(upload):
+        upload.seek(0)
+        return Image.open(upload)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=(300, 300))
+    def test_metadata_stripped_and_size_capped(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        exif[0x8825] = {2: (55.0, 45.0, 0.0)}
+        upload = StreamingBase64ImageField().to_internal_value(
+            self.encoded(Image.new("RGB", (600, 150)), exif=exif.tobytes())
+        )
+        upload.seek(0)
+        self.assertEqual(upload.size, len(upload.read()))
+        image = self.stored(upload)
+        self.assertEqual(image.size, (300, 75))
+        self.assertEqual(len(image.getexif()), 0)
+
+    def rejected(self, data):
+        with self.assertRaises(ValidationError) as context:
+            StreamingBase64ImageField().to_internal_value(data)
+        return context.exception.detail[0].code
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=1024)
+    def test_oversized_payload(self):
+        data = self.encoded(
+            Image.frombytes("L", (64, 64), os.urandom(64 * 64)), fmt="PNG"
+        )
+        with mock.patch.object(StreamingBase64ImageField, "decode") as decode:
+            self.assertEqual(self.rejected(data), "too_large")
+        decode.assert_not_called()
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        data = self.encoded(Image.new("RGB", (20, 20)))
+        self.assertEqual(self.rejected(data), "too_many_pixels")
+
+    def test_decompression_bomb(self):
+        data = self.encoded(Image.new("RGB", (20, 20)), fmt="PNG")
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 100):
+            self.assertEqual(self.rejected(data), "too_many_pixels")
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    FEED_ASYNC=False,
+    RECIPE_IMAGE_ASYNC=False,
+    RELATED_RECIPES_ASYNC=False,
+)
+class TimelineTests(APITransactionTestCase):
+    """Feeds are fanned out on write, backfilled and pruned on follows."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user, self.author = (
+            User.objects.create_user(
+                username=username, email=f"{username}@example.com"
+            )
+            for username in ("reader", "author")
+        )
+        self.tokens = {
+            user: Token.objects.create(user=user).key
+            for user in (self.user, self.author)
+        }
+        self.tag = Tag.objects.create(name="Tag", color="#000000", slug="tag")
+        self.ingredient = Ingredient.objects.create(
+            name="Flour", measurement_unit="g"
+        )
+
+    def login(self, user):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {self.tokens[user]}"
+        )
+
+    def create_recipes(self, count):
+        return [
+            Recipe.objects.create(
+                author=self.author,
+                name=f"Recipe {index}",
+                image="recipes/images/recipe.png",
+                processed_image="recipes/images/recipe.png",
+                text="Text",
+                cooking_time=10,
+            ).id
+            for index in range(count)
+        ]
+
+    def entries(self):
+        return sorted(
+            TimelineEntry.objects.filter(user=self.user).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+    def feed(self, query=""):
+        self.login(self.user)
+        response = self.client.get(f"/api/users/feed/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_new_recipe_fanned_out(self):
+        Subscription.objects.create(user=self.user, author=self.author)
+        buffer = BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, format="PNG")
+        image = base64.b64encode(buffer.getvalue()).decode()
+        self.login(self.author)
+        response = self.client.post(
+            "/api/recipes/",
+            {
+                "name": "Bread",
+                "text": "Text",
+                "cooking_time": 5,
+                "image": f"data:image/png;base64,{image}",
+                "tags": [self.tag.id],
+                "ingredients": [{"id": self.ingredient.id, "amount": 2}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.entries(), [response.data["id"]])
+        self.assertEqual(
+            [recipe["name"] for recipe in self.feed()["results"]], ["Bread"]
+        )
+
+    def test_backfill_and_prune(self):
+        recipe_ids = self.create_recipes(3)
+        self.login(self.user)
+        url = f"/api/users/{self.author.id}/subscribe/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.entries(), recipe_ids)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.entries(), [])
+
+    def test_keyset_pages(self):
+        recipe_ids = self.create_recipes(5)[::-1]
+        self.login(self.user)
+        self.client.post(f"/api/users/{self.author.id}/subscribe/")
+        pages, query = [], "limit=2"
+        while query is not None:
+            data = self.feed(query)
+            pages.append([recipe["id"] for recipe in data["results"]])
+            query = data["next"] and data["next"].split("?", 1)[1]
+        self.assertEqual(
+            pages, [recipe_ids[:2], recipe_ids[2:4], recipe_ids[4:]]
+        )
+        data = self.feed(f"before={recipe_ids[1]}")
+        self.assertEqual(
+            [recipe["id"] for recipe in data["results"]], recipe_ids[2:]
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_pulled(self):
+        recipe_ids = self.create_recipes(3)[::-1]
+        self.login(self.user)
+        self.client.post(f"/api/users/{self.author.id}/subscribe/")
+        self.assertEqual(self.entries(), [])
+        self.assertEqual(
+            [recipe["id"] for recipe in self.feed()["results"]], recipe_ids
+        )
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(APITransactionTestCase):
+    """Safe reads go to a replica, writes and pinned clients to primary.
+
+    The replica is a second connection to the test database.
+    """
+
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases["replica"] = {
+            **connections["default"].settings_dict,
+            "TEST": {"MIRROR": "default"},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections.databases["replica"]
+        del connections._connections.replica
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(
+            username="user", email="user@example.com"
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name="Recipe",
+            image="recipes/images/recipe.png",
+            processed_image="recipes/images/recipe.png",
+            text="Text",
+            cooking_time=10,
+        )
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def request(self, method, url):
+        with CaptureQueriesContext(
+            connections["default"]
+        ) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 400)
+        return response, len(primary), len(replica)
+
+    def test_safe_reads_use_replica(self):
+        _, _, replica = self.request("get", f"/api/recipes/{self.recipe.id}/")
+        self.assertGreater(replica, 0)
+
+    def test_writes_pin_to_primary(self):
+        response, primary, replica = self.request(
+            "post", f"/api/recipes/{self.recipe.id}/favorite/"
+        )
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        _, primary, replica = self.request(
+            "get", f"/api/recipes/{self.recipe.id}/"
+        )
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_reads_after_write_use_primary(self):
+        router = PrimaryReplicaRouter()
+        read_from_replica(True)
+        try:
+            self.assertEqual(router.db_for_read(Recipe), "replica")
+            self.assertEqual(router.db_for_read(Token), "default")
+            router.db_for_write(Recipe)
+            self.assertEqual(router.db_for_read(Recipe), "default")
+        finally:
+            read_from_replica(False)
+
+    @override_settings(DATABASE_HEALTH_CHECKS=True)
+    def test_health_checks_rate_limited(self):
+        for alias in self.databases:
+            connections[alias].ensure_connection()
+            connections[alias].health_checked_at = None
+        with mock.patch.object(
+            type(connections["default"]), "is_usable", return_value=True
+        ) as is_usable:
+            for _ in range(3):
+                self.request("get", f"/api/recipes/{self.recipe.id}/")
+        self.assertEqual(is_usable.call_count, len(self.databases))
@@ -1,8 +1,19 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.vary import vary_on_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import _positive_int
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
@@ -18,16 +29,36 @@ from recipes.models import (
     Subscription,
     Tag,
 )
+from recipes.similarity import related_recipe_ids
+from recipes.timelines import (
+    backfill,
+    feed_recipe_ids,
+    prune,
+    schedule_timeline_task,
+)
 from users.models import User
-from .filters import IngredientSearchFilter, RecipesFilterSet
-from .pagination import CustomPageLimitPagination
+from .conditional import recipe_condition, table_condition
+from .cookable_index import cookable_index
+from .filters import RecipesFilterSet
+from .ingredient_index import ingredient_index
+from .list_cache import get_cached_list, set_cached_list
+from .negotiation import QueryFormatContentNegotiation
+from .pagination import (
+    CustomPageLimitPagination,
+    KeysetPagination,
+    PageLimitPagination,
+)
+from .payloads import RECIPE_FIELDS, recipe_payloads, subscription_payloads
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (
+    CookableSerializer,
     CustomUserCreateSerializer,
     FavoriteSerializer,
     IngredientSerializer,
+    RecipeBatchSerializer,
     RecipeCreateSerializer,
     RecipeReadSerializer,
+    RecipeShortSerializer,
     SetPasswordSerializer,
     ShoppingCartSerializer,
     SubscriptionCreateSerializer,
@@ -35,7 +66,23 @@ from .serializers import (
     TagSerializer,
     UserProfileSerializer,
 )
-from .services import generate_shopping_list
+from .services import (
+    add_recipes,
+    attach_recipes_window,
+    generate_shopping_list,
+    remove_recipes,
+)
+
+
+def positive_int_param(request, name):
+    """Positive integer query parameter, None when missing or empty."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return _positive_int(value, strict=True)
+    except ValueError:
+        raise ValidationError({name: "Must be a positive integer."})
 
 
 class IngredientsViewSet(ReadOnlyModelViewSet):
@@ -44,8 +91,19 @@ class IngredientsViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ("^name",)
+
+    @method_decorator(table_condition("ingredients"))
+    def list(self, request, *args, **kwargs):
+        return Response(
+            ingredient_index.search(
+                request.query_params.get("name", ""),
+                positive_int_param(request, "limit"),
+            )
+        )
+
+    @method_decorator(table_condition("ingredients"))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class TagsViewSet(ReadOnlyModelViewSet):
@@ -55,6 +113,14 @@ class TagsViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @method_decorator(table_condition("tags"))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(table_condition("tags"))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(ModelViewSet):
     """ViewSet for Recipe [GET, GET-list, POST, PATCH, DELETE]."""
@@ -65,11 +131,56 @@ class RecipeViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilterSet
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("retrieve", "list"):
+            return queryset.with_related()
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ("retrieve", "list"):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    def build_list(self, request, *args, **kwargs):
+        if not settings.FAST_READ_PATH:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(
+            queryset.prefetch_related(None).values(*RECIPE_FIELDS)
+        )
+        return self.get_paginated_response(recipe_payloads(request, page))
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return self.build_list(request, *args, **kwargs)
+        content = get_cached_list(request)
+        if content is not None:
+            return HttpResponse(
+                content, content_type=request.accepted_media_type
+            )
+        response = self.build_list(request, *args, **kwargs)
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        set_cached_list(request, response.render().content)
+        return response
+
+    @method_decorator([vary_on_headers("Authorization"), recipe_condition])
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.FAST_READ_PATH:
+            return super().retrieve(request, *args, **kwargs)
+        rows = recipe_payloads(
+            request,
+            self.get_queryset()
+            .filter(pk=kwargs["pk"])
+            .prefetch_related(None)
+            .values(*RECIPE_FIELDS),
+        )
+        if not rows:
+            raise Http404
+        return Response(rows[0])
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -78,7 +189,8 @@ class RecipeViewSet(ModelViewSet):
         data = {"user": request.user.id, "recipe": pk}
         serializer = serializers(data=data, context={"request": request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
@@ -89,6 +201,29 @@ class RecipeViewSet(ModelViewSet):
         model_obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def batch_method_for_actions(request, model):
+        serializer = RecipeBatchSerializer(
+            data=request.data, context={"request": request, "model": model}
+        )
+        serializer.is_valid(raise_exception=True)
+        members = serializer.validated_data["recipes"]
+        if request.method == "DELETE":
+            remove_recipes(
+                request.user,
+                model,
+                [pk for pk, member in members.items() if member],
+            )
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        added = [pk for pk, member in members.items() if not member]
+        add_recipes(request.user, model, added)
+        serializer = RecipeShortSerializer(
+            Recipe.objects.filter(pk__in=added),
+            many=True,
+            context={"request": request},
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=True, methods=["POST"], permission_classes=[IsAuthenticated]
     )
@@ -118,10 +253,80 @@ class RecipeViewSet(ModelViewSet):
         )
 
     @action(
-        detail=False, methods=["get"], permission_classes=[IsAuthenticated]
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="favorite/batch",
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        return self.batch_method_for_actions(request=request, model=Favorite)
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="shopping_cart/batch",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_method_for_actions(
+            request=request, model=ShoppingCart
+        )
+
+    @action(detail=True, methods=["GET"])
+    def related(self, request, pk):
+        recipe_ids = related_recipe_ids(pk)
+        if recipe_ids is None:
+            get_object_or_404(Recipe, pk=pk)
+            recipe_ids = []
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        serializer = RecipeShortSerializer(
+            [
+                recipes[recipe_id]
+                for recipe_id in recipe_ids
+                if recipe_id in recipes
+            ],
+            many=True,
+            context={"request": request},
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        pagination_class=PageLimitPagination,
+    )
+    def cookable(self, request):
+        serializer = CookableSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        matches = cookable_index.match(
+            serializer.validated_data["ingredients"],
+            request.query_params.getlist("tags"),
+            serializer.validated_data.get("max_missing"),
+        )
+        page = self.paginate_queryset(matches)
+        recipes = Recipe.objects.with_related().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        results = []
+        for recipe_id, missing in page:
+            if recipe_id in recipes:
+                data = RecipeReadSerializer(
+                    recipes[recipe_id], context={"request": request}
+                ).data
+                data["missing_ingredients"] = missing
+                results.append(data)
+        return self.get_paginated_response(results)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=QueryFormatContentNegotiation,
     )
     def download_shopping_cart(self, request):
-        return generate_shopping_list(request.user)
+        return generate_shopping_list(
+            request.user, request.query_params.get("format", "txt")
+        )
 
 
 class CustomUserViewSet(UserViewSet):
@@ -147,8 +352,20 @@ class CustomUserViewSet(UserViewSet):
         detail=False, methods=["GET"], permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscriptions__user=request.user)
-        pages = self.paginate_queryset(queryset)
+        queryset = (
+            User.objects.filter(subscriptions__user=request.user)
+            .annotate(
+                recipes_count=Coalesce("stats__recipes_count", 0),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            )
+            .order_by("id")
+        )
+        recipes_limit = positive_int_param(request, "recipes_limit")
+        pages = attach_recipes_window(
+            self.paginate_queryset(queryset), recipes_limit
+        )
+        if settings.FAST_READ_PATH:
+            return self.get_paginated_response(subscription_payloads(pages))
         serializer = SubscriptionSerializer(
             pages,
             many=True,
@@ -156,6 +373,28 @@ class CustomUserViewSet(UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=["GET"],
+        permission_classes=[IsAuthenticated],
+        pagination_class=KeysetPagination,
+    )
+    def feed(self, request):
+        recipe_ids = self.paginate_queryset(
+            partial(feed_recipe_ids, request.user)
+        )
+        recipes = Recipe.objects.with_related().in_bulk(recipe_ids)
+        serializer = RecipeReadSerializer(
+            [
+                recipes[recipe_id]
+                for recipe_id in recipe_ids
+                if recipe_id in recipes
+            ],
+            many=True,
+            context={"request": request},
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True, methods=["POST"], permission_classes=[IsAuthenticated]
     )
@@ -165,7 +404,13 @@ class CustomUserViewSet(UserViewSet):
             data=data, context={"request": request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            instance = serializer.save()
+        transaction.on_commit(
+            lambda: schedule_timeline_task(
+                backfill, request.user.id, instance.author_id
+            )
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
@@ -174,4 +419,7 @@ class CustomUserViewSet(UserViewSet):
         author = get_object_or_404(User, id=id)
         instance = get_object_or_404(Subscription, user=user, author=author)
         instance.delete()
+        transaction.on_commit(
+            lambda: schedule_timeline_task(prune, user.id, author.id)
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from itertools import zip_longest
 
 from distutils.util import strtobool
 from dotenv import load_dotenv
@@ -31,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.PerformanceMiddleware",
+    "api.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -81,6 +85,85 @@ else:
         }
     }
 
+# Persistent connections live per serving thread, so gunicorn.conf.py runs
+# DATABASE_POOL_SIZE threads per worker to bound connections per process.
+DATABASE_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", 60))
+DATABASE_HEALTH_CHECKS = bool(strtobool(os.getenv("DB_HEALTH_CHECKS", "True")))
+DATABASE_HEALTH_CHECK_INTERVAL = int(
+    os.getenv("DB_HEALTH_CHECK_INTERVAL", 30)
+)
+DATABASE_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+DATABASES["default"]["CONN_MAX_AGE"] = DATABASE_CONN_MAX_AGE
+
+# Replicas copy the default database with another host (DB_REPLICA_HOSTS)
+# or database name (DB_REPLICA_NAMES), e.g. a second SQLite file locally.
+DATABASE_REPLICAS = []
+for index, (host, name) in enumerate(
+    zip_longest(
+        os.getenv("DB_REPLICA_HOSTS", "").split(),
+        os.getenv("DB_REPLICA_NAMES", "").split(),
+    ),
+    start=1,
+):
+    alias = f"replica{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host or DATABASES["default"].get("HOST"),
+        "NAME": name or DATABASES["default"]["NAME"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_REPLICA_APPS = ("recipes", "users", "auth")
+DATABASE_REPLICA_PIN_SECONDS = 5
+DATABASE_ROUTERS = ["api.routers.PrimaryReplicaRouter"]
+
+# The default cache keeps table versions and other state every worker
+# process must agree on, so it has to be shared by all of them: the
+# file-based default covers the workers and management commands of one
+# host, several hosts need memcached or another network backend.
+# Rendered recipe list pages are keyed by those versions, so they may stay
+# in the memory of each process.
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+CACHE_BACKEND = os.getenv(
+    "CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+)
+CACHE_LOCATION = os.getenv(
+    "CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "foodgram-cache")
+)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10_000))
+
+RECIPE_LIST_CACHE_BACKEND = os.getenv(
+    "RECIPE_LIST_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+RECIPE_LIST_CACHE_MAX_ENTRIES = int(
+    os.getenv("RECIPE_LIST_CACHE_MAX_ENTRIES", 1000)
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": CACHE_LOCATION,
+    },
+    "recipe_list": {
+        "BACKEND": RECIPE_LIST_CACHE_BACKEND,
+        "LOCATION": os.getenv("RECIPE_LIST_CACHE_LOCATION", "recipe-list"),
+        "TIMEOUT": 5 * 60,
+    },
+}
+
+if CACHE_BACKEND.endswith("FileBasedCache"):
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": CACHE_MAX_ENTRIES}
+
+if RECIPE_LIST_CACHE_BACKEND.endswith("LocMemCache"):
+    # Culling one entry at a time turns locmem's culling into plain LRU.
+    CACHES["recipe_list"]["OPTIONS"] = {
+        "MAX_ENTRIES": RECIPE_LIST_CACHE_MAX_ENTRIES,
+        "CULL_FREQUENCY": RECIPE_LIST_CACHE_MAX_ENTRIES,
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -114,6 +197,10 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.TokenAuthentication",
     ),
@@ -139,3 +226,45 @@ DJOSER = {
 }
 
 FILENAME_FOR_SERVICES = "shopping_list.txt"
+
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+
+RECIPE_BATCH_MAX_SIZE = 100
+COOKABLE_MAX_INGREDIENTS = 500
+
+RECIPE_SEARCH_CONFIG = os.getenv("RECIPE_SEARCH_CONFIG", "russian")
+
+RECIPE_SCORE_WEIGHTS = {"favorite": 2, "shoppingcart": 1}
+RECIPE_TRENDING_HALF_LIFE = 24 * 60 * 60
+RECIPE_TRENDING_WINDOW = 7 * 24 * 60 * 60
+
+RELATED_RECIPES_COUNT = 12
+RELATED_RECIPES_TAG_WEIGHT = 0.5
+RELATED_RECIPES_MAX_POSTINGS = 1000
+RELATED_RECIPES_ASYNC = True
+RELATED_RECIPES_WORKERS = 1
+RELATED_RECIPES_QUEUE_SIZE = 256
+
+FAST_READ_PATH = bool(strtobool(os.getenv("FAST_READ_PATH", "False")))
+
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_MAX_SIZE = (2400, 2400)
+RECIPE_IMAGE_VARIANTS = {"card": (480, 480), "detail": (1200, 1200)}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_ASYNC = True
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_QUEUE_SIZE = 32
+
+FEED_FANOUT_MAX_FOLLOWERS = 10_000
+FEED_BACKFILL_SIZE = 200
+FEED_BATCH_SIZE = 1000
+FEED_ASYNC = True
+FEED_WORKERS = 2
+FEED_QUEUE_SIZE = 256
+
+PERF_MIDDLEWARE = bool(strtobool(os.getenv("PERF_MIDDLEWARE", "False")))
+PERF_SLOW_QUERY_MS = int(os.getenv("PERF_SLOW_QUERY_MS", 100))
+PERF_SAMPLES_PER_VIEW = 1000
+PERF_FLUSH_INTERVAL = 10
+PERF_STATS_TIMEOUT = 24 * 60 * 60
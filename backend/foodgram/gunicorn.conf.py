@@ -0,0 +1,15 @@
+import os
+
+from foodgram.settings import (
+    CACHES,
+    DATABASE_POOL_SIZE,
+    PROCESS_LOCAL_CACHE_BACKENDS,
+)
+
+# Table versions, memberships and performance samples are coordinated
+# through the default cache, so several workers need a shared one.
+SHARED_CACHE = CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+bind = "0:8000"
+workers = int(os.getenv("GUNICORN_WORKERS", 2 if SHARED_CACHE else 1))
+threads = DATABASE_POOL_SIZE
@@ -49,9 +49,10 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = "-empty-"
 
     def favorite_count(self, obj):
-        return f"Favorited {Favorite.objects.filter(recipe=obj).count()} times"
+        return f"Favorited {obj.favorites_count} times"
 
     favorite_count.short_description = "Qty of addition to favorites"
+    favorite_count.admin_order_field = "favorites_count"
 
 
 @admin.register(RecipeIngredient)
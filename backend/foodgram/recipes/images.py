@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from api.list_cache import invalidate_recipe_lists
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("webp", "jpeg") if features.check("webp") else ("jpeg",)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix="recipe-images",
+)
+pending = threading.BoundedSemaphore(settings.RECIPE_IMAGE_QUEUE_SIZE)
+
+
+def variant_names(image_name):
+    """Storage names of the resized copies of a recipe image."""
+    stem, _ = os.path.splitext(image_name)
+    return {
+        variant: {fmt: f"{stem}_{variant}.{fmt}" for fmt in FORMATS}
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def encode(image, fmt):
+    if fmt == "jpeg" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        if image.mode in ("RGBA", "LA"):
+            background.paste(image, mask=image.getchannel("A"))
+        else:
+            background.paste(image.convert("RGB"))
+        image = background
+    buffer = BytesIO()
+    image.save(
+        buffer, format=fmt.upper(), quality=settings.RECIPE_IMAGE_QUALITY
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def write_variants(storage, name, targets):
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    for variant, names in targets.items():
+        size = settings.RECIPE_IMAGE_VARIANTS[variant]
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for fmt, target in names.items():
+            storage.save(target, encode(resized, fmt))
+
+
+def process_recipe_image(recipe_id):
+    """Write metadata-free, size-capped card and detail copies of an image.
+
+    The stored image, already stripped and capped on upload, is kept as
+    is. Variants that already exist, e.g. of an identical image used by
+    another recipe, are not written again. The recipe is marked as
+    updated, so cached pages and validators pick up the variant URLs.
+    """
+    recipe = (
+        Recipe.objects.filter(pk=recipe_id)
+        .only("author", "image", "processed_image")
+        .first()
+    )
+    if recipe is None or not recipe.image:
+        return
+    name = recipe.image.name
+    if name == recipe.processed_image:
+        return
+    storage = recipe.image.storage
+    missing = {}
+    for variant, names in variant_names(name).items():
+        targets = {
+            fmt: target
+            for fmt, target in names.items()
+            if not storage.exists(target)
+        }
+        if targets:
+            missing[variant] = targets
+    if missing:
+        write_variants(storage, name, missing)
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        processed_image=name, updated_at=timezone.now()
+    )
+    if updated:
+        invalidate_recipe_lists(
+            recipe.author_id,
+            list(recipe.tags.values_list("slug", flat=True)),
+        )
+
+
+def run(recipe_id, release=False):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception("Processing image of recipe %s failed", recipe_id)
+    finally:
+        if release:
+            pending.release()
+            connection.close()
+
+
+def schedule_recipe_image(recipe_id):
+    """Process the image on the worker pool, or inline when it is full."""
+    if settings.RECIPE_IMAGE_ASYNC and pending.acquire(blocking=False):
+        executor.submit(run, recipe_id, release=True)
+    else:
+        run(recipe_id)
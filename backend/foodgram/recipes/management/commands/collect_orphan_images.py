@@ -0,0 +1,92 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.models import Recipe
+from recipes.storage import image_storage
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f"{directory}/{name}"
+    for name in directories:
+        yield from walk(storage, f"{directory}/{name}")
+
+
+class Command(BaseCommand):
+    """Custom command to delete recipe images no recipe refers to."""
+
+    help = (
+        "Deletes image files and their variants that are not referenced "
+        "by any recipe"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help="Keep files modified less than this many seconds ago",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    @staticmethod
+    def is_referenced(stem):
+        return Recipe.objects.filter(image__startswith=f"{stem}.").exists()
+
+    def is_orphan(self, path, cutoff):
+        """Whether path is still unreferenced and old, right before deleting.
+
+        Uploads reusing a file and recipes committed since the scan started
+        are caught here rather than left pointing at a deleted image.
+        """
+        return image_storage.get_modified_time(
+            path
+        ) <= cutoff and not self.is_referenced(self.source_stem(path))
+
+    @staticmethod
+    def source_stem(path):
+        stem = os.path.splitext(path)[0]
+        for variant in settings.RECIPE_IMAGE_VARIANTS:
+            suffix = f"_{variant}"
+            if stem.endswith(suffix):
+                return stem[:-len(suffix)]
+        return stem
+
+    def handle(self, *args, **options):
+        references = {
+            os.path.splitext(row["image"])[0]: row["count"]
+            for row in Recipe.objects.exclude(image="")
+            .values("image")
+            .annotate(count=Count("id"))
+            .order_by()
+        }
+        cutoff = timezone.now() - timedelta(seconds=options["min_age"])
+        orphans = []
+        size = 0
+        for path in walk(image_storage, "images"):
+            stem = os.path.splitext(path)[0]
+            if references.get(stem) or references.get(self.source_stem(path)):
+                continue
+            if image_storage.get_modified_time(path) > cutoff:
+                continue
+            if options["dry_run"]:
+                size += image_storage.size(path)
+            elif self.is_orphan(path, cutoff):
+                size += image_storage.size(path)
+                image_storage.delete(path)
+            else:
+                continue
+            orphans.append(path)
+        action = "Found" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            f"{action} {len(orphans)} orphaned files ({size / 2 ** 20:.1f} "
+            f"MiB), {len(references)} images referenced."
+        )
@@ -0,0 +1,249 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from api.conditional import bump_version
+from api.cookable_index import cookable_index
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag,
+)
+from recipes.storage import content_hash_path, image_storage
+from users.models import User
+
+USERNAME_PREFIX = "synthetic_"
+
+
+def zipf_weights(count, exponent):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def batched(objects, size):
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    """Custom command to fill the database with a synthetic dataset."""
+
+    help = (
+        "Generates users, recipes, tags, favorites, shopping carts and a "
+        "power-law subscription graph with bulk inserts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=8)
+        parser.add_argument(
+            "--ingredients",
+            type=int,
+            nargs=2,
+            default=(3, 15),
+            metavar=("MIN", "MAX"),
+            help="Range of ingredients per recipe, 8 on average by default",
+        )
+        parser.add_argument("--favorites", type=int, default=30)
+        parser.add_argument("--cart", type=int, default=5)
+        parser.add_argument("--subscriptions", type=int, default=20)
+        parser.add_argument(
+            "--exponent",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of author and recipe popularity",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete a previously generated dataset first",
+        )
+
+    def create_users(self, count):
+        password = make_password("synthetic-password")
+        self.bulk_insert(
+            User(
+                username=f"{USERNAME_PREFIX}{index}",
+                email=f"{USERNAME_PREFIX}{index}@example.com",
+                first_name="Synthetic",
+                last_name=f"User {index}",
+                password=password,
+            )
+            for index in range(count)
+        )
+        return list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    @staticmethod
+    def create_tags(count):
+        for index in range(count):
+            Tag.objects.get_or_create(
+                slug=f"synthetic-{index}",
+                defaults={
+                    "name": f"Synthetic {index}",
+                    "color": f"#{index * 7919 % 0xFFFFFF:06X}",
+                },
+            )
+        return list(
+            Tag.objects.filter(slug__startswith="synthetic-").values_list(
+                "id", "slug"
+            )
+        )
+
+    @staticmethod
+    def placeholder_image():
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "orange").save(buffer, format="PNG")
+        recipe = Recipe(image=ContentFile(buffer.getvalue(), "synthetic.png"))
+        return image_storage.save(
+            content_hash_path(recipe, "synthetic.png"), recipe.image
+        )
+
+    def create_recipes(self, authors, count):
+        image = self.placeholder_image()
+        weights = zipf_weights(len(authors), self.exponent)
+        self.bulk_insert(
+            Recipe(
+                author_id=author,
+                name=f"Synthetic recipe {index}",
+                image=image,
+                text="Mix everything and cook. " * 5,
+                cooking_time=self.random.randint(5, 180),
+            )
+            for index, author in enumerate(
+                self.random.choices(authors, weights, k=count)
+            )
+        )
+        return list(
+            Recipe.objects.filter(author_id__in=authors)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def recipe_rows(self, recipes, ingredients, tags, minimum, maximum):
+        mode = (minimum + maximum) // 3
+        for recipe in recipes:
+            count = round(self.random.triangular(minimum, maximum, mode))
+            for ingredient in self.random.sample(
+                ingredients, min(count, len(ingredients))
+            ):
+                yield RecipeIngredient(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500),
+                )
+            for tag in self.random.sample(tags, self.random.randint(1, 2)):
+                yield Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+
+    def pick(self, population, weights, count, exclude=None):
+        chosen = set(self.random.choices(population, weights, k=count))
+        chosen.discard(exclude)
+        return chosen
+
+    def relation_rows(self, users, recipes, per_user):
+        now = timezone.now()
+        recipe_weights = zipf_weights(len(recipes), self.exponent)
+        author_weights = zipf_weights(len(users), self.exponent)
+        for user in users:
+            for recipe in self.pick(recipes, recipe_weights, per_user[0]):
+                yield Favorite(
+                    user_id=user,
+                    recipe_id=recipe,
+                    created=now - timedelta(days=self.random.random() * 30),
+                )
+            for recipe in self.random.sample(recipes, per_user[1]):
+                yield ShoppingCart(
+                    user_id=user,
+                    recipe_id=recipe,
+                    created=now - timedelta(days=self.random.random() * 30),
+                )
+            count = round(self.random.paretovariate(1.5) * per_user[2] / 3)
+            for author in self.pick(
+                users, author_weights, min(count, len(users)), exclude=user
+            ):
+                yield Subscription(user_id=user, author_id=author)
+
+    def bulk_insert(self, rows):
+        """Insert objects of any models from rows, a batch at a time."""
+        count = 0
+        for batch in batched(rows, self.batch_size):
+            by_model = {}
+            for row in batch:
+                by_model.setdefault(type(row), []).append(row)
+            for model, objects in by_model.items():
+                model.objects.bulk_create(objects, ignore_conflicts=True)
+            count += len(batch)
+        return count
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.exponent = options["exponent"]
+        existing = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        if options["flush"]:
+            existing.delete()
+        elif existing.exists():
+            raise CommandError("Synthetic data exists, use --flush.")
+        ingredients = list(Ingredient.objects.values_list("id", flat=True))
+        if not ingredients:
+            raise CommandError("No ingredients loaded, run load_data first.")
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = self.create_users(options["users"])
+            tags = self.create_tags(options["tags"])
+            recipes = self.create_recipes(users, options["recipes"])
+            rows = self.bulk_insert(
+                self.recipe_rows(
+                    recipes,
+                    ingredients,
+                    [pk for pk, _ in tags],
+                    *options["ingredients"],
+                )
+            )
+            rows += self.bulk_insert(
+                self.relation_rows(
+                    users,
+                    recipes,
+                    (
+                        options["favorites"],
+                        options["cart"],
+                        options["subscriptions"],
+                    ),
+                )
+            )
+        call_command("repair_counters", stdout=self.stdout)
+        call_command("refresh_recipe_scores", "--full", stdout=self.stdout)
+        call_command("rebuild_search_index", stdout=self.stdout)
+        call_command("refresh_related_recipes", stdout=self.stdout)
+        call_command("rebuild_timelines", stdout=self.stdout)
+        bump_version("tags")
+        bump_version("recipes:all")
+        cookable_index.invalidate()
+        for _, slug in tags:
+            bump_version(f"recipes:tag:{slug}")
+        self.stdout.write(
+            f"Generated {len(users)} users, {len(recipes)} recipes and "
+            f"{rows} related rows in {time.perf_counter() - started:.1f}s."
+        )
@@ -1,23 +1,162 @@
 import csv
+import gzip
+import json
+import os
+import time
+from itertools import islice
 
+from django.conf import settings
 from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, "data", "ingredients.csv")
+
+
+def open_source(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Yield items of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("JSON data must be an array of ingredients")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item["name"], item["measurement_unit"]
+
+
+class CSVStream:
+    """File-like object serializing rows to CSV on read, for COPY."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ""
+        self.writer = csv.writer(self, lineterminator="\n")
+        self.count = 0
+
+    def write(self, value):
+        self.buffer += value
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.count += 1
+        data = self.buffer if size < 0 else self.buffer[:size]
+        self.buffer = self.buffer[len(data):]
+        return data
+
 
 class Command(BaseCommand):
-    """Custom command to load data from CSV file into database ."""
+    """Custom command to load ingredients from CSV or JSON into database."""
+
+    help = (
+        "Loads ingredients from a CSV or JSON file (optionally gzip'ed), "
+        "skipping ones that already exist or repeat"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json"),
+            help="File format, detected from the extension by default",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Use COPY into a staging table (PostgreSQL only)",
+        )
+
+    @staticmethod
+    def bulk_insert(rows, batch_size):
+        count = 0
+        while True:
+            batch = [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                return count
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
 
-    help = "Loads data from ingredients.csv"
+    @staticmethod
+    def copy_insert(rows):
+        table = Ingredient._meta.db_table
+        stream = CSVStream(rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE ingredient_staging "
+                "(name varchar(100), measurement_unit varchar(20)) "
+                "ON COMMIT DROP"
+            )
+            cursor.copy_expert(
+                "COPY ingredient_staging FROM STDIN WITH (FORMAT csv)", stream
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT ON (name) name, measurement_unit "
+                "FROM ingredient_staging ON CONFLICT (name) DO NOTHING"
+            )
+        return stream.count
 
     def handle(self, *args, **options):
-        with open("data/ingredients.csv") as isfile:
-            reader = csv.reader(isfile)
-            try:
-                for row in reader:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name, measurement_unit=measurement_unit
-                    )
-            except Exception as error:
-                raise CommandError(f"Data not loaded: {error}.")
+        path = options["path"]
+        name = path[:-len(".gz")] if path.endswith(".gz") else path
+        file_format = options["format"] or (
+            "json" if name.endswith(".json") else "csv"
+        )
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy is only supported on PostgreSQL.")
+        reader = read_json if file_format == "json" else read_csv
+        started = time.perf_counter()
+        existing = Ingredient.objects.count()
+        try:
+            with open_source(path) as file, transaction.atomic():
+                rows = reader(file)
+                if options["copy"]:
+                    count = self.copy_insert(rows)
+                else:
+                    count = self.bulk_insert(rows, options["batch_size"])
+        except Exception as error:
+            raise CommandError(f"Data not loaded: {error}.")
+        created = Ingredient.objects.count() - existing
+        ingredient_index.invalidate()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Read {count} rows, created {created} ingredients, "
+            f"skipped {count - created} existing or duplicate "
+            f"in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)."
+        )
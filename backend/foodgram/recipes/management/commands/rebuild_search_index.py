@@ -0,0 +1,29 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import create_search_table, update_search_documents
+
+
+class Command(BaseCommand):
+    """Custom command to rebuild full-text search documents of recipes."""
+
+    help = "Rebuilds the recipe search documents in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        create_search_table()
+        started = time.perf_counter()
+        ids = list(Recipe.objects.order_by("id").values_list("id", flat=True))
+        size = options["batch_size"]
+        for start in range(0, len(ids), size):
+            with transaction.atomic():
+                update_search_documents(ids[start:start + size])
+        self.stdout.write(
+            f"Indexed {len(ids)} recipes "
+            f"in {time.perf_counter() - started:.1f}s."
+        )
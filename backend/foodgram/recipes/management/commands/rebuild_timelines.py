@@ -0,0 +1,30 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Subscription, TimelineEntry
+from recipes.timelines import backfill
+
+
+class Command(BaseCommand):
+    """Custom command to rebuild feed timelines from subscriptions."""
+
+    help = (
+        "Refills the timelines of all users with the latest recipes of the "
+        "authors they follow"
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        subscriptions = Subscription.objects.values_list(
+            "user_id", "author_id"
+        )
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            for user_id, author_id in subscriptions.iterator():
+                backfill(user_id, author_id)
+        self.stdout.write(
+            f"Rebuilt {TimelineEntry.objects.count()} timeline entries in "
+            f"{time.perf_counter() - started:.2f}s."
+        )
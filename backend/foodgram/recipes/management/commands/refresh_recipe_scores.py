@@ -0,0 +1,78 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from api.list_cache import invalidate_ranked_lists
+from recipes.models import Favorite, Recipe, RecipeScore, ShoppingCart
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Custom command to refresh precomputed recipe scores."""
+
+    help = (
+        "Recomputes time-decayed trending scores from recent favorites and "
+        "cart adds; with --full also rebuilds popularity from counters"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true")
+
+    @staticmethod
+    def trending_scores(now):
+        since = now - timedelta(seconds=settings.RECIPE_TRENDING_WINDOW)
+        scores = defaultdict(float)
+        for model in (Favorite, ShoppingCart):
+            weight = settings.RECIPE_SCORE_WEIGHTS[model._meta.model_name]
+            events = model.objects.filter(created__gte=since).values_list(
+                "recipe_id", "created"
+            )
+            for recipe_id, created in events.iterator():
+                age = (now - created).total_seconds()
+                scores[recipe_id] += weight * 0.5 ** (
+                    age / settings.RECIPE_TRENDING_HALF_LIFE
+                )
+        return scores
+
+    @staticmethod
+    def rebuild_popularity():
+        weights = settings.RECIPE_SCORE_WEIGHTS
+        popularity = Recipe.objects.filter(pk=OuterRef("recipe_id")).values(
+            popularity=F("favorites_count") * weights["favorite"]
+            + F("cart_count") * weights["shoppingcart"]
+        )
+        RecipeScore.objects.update(popularity=Subquery(popularity))
+
+    def handle(self, *args, **options):
+        scores = self.trending_scores(timezone.now())
+        with transaction.atomic():
+            RecipeScore.objects.bulk_create(
+                [
+                    RecipeScore(recipe_id=pk)
+                    for pk in Recipe.objects.filter(
+                        score__isnull=True
+                    ).values_list("pk", flat=True)
+                ],
+                ignore_conflicts=True,
+            )
+            if options["full"]:
+                self.rebuild_popularity()
+            RecipeScore.objects.filter(trending__gt=0).update(trending=0)
+            RecipeScore.objects.bulk_update(
+                [
+                    RecipeScore(recipe_id=recipe_id, trending=score)
+                    for recipe_id, score in scores.items()
+                ],
+                ["trending"],
+                batch_size=BATCH_SIZE,
+            )
+        invalidate_ranked_lists()
+        self.stdout.write(
+            f"Refreshed trending scores of {len(scores)} recipes."
+        )
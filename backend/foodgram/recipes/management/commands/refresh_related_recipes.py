@@ -0,0 +1,42 @@
+import time
+from itertools import islice
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe, RelatedRecipes
+from recipes.similarity import feature_rows, related_recipes
+
+
+class Command(BaseCommand):
+    """Custom command to recompute related recipes of every recipe."""
+
+    help = (
+        "Recomputes the most similar recipes of every recipe by ingredient "
+        "and tag overlap"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipes = {
+            pk: set() for pk in Recipe.objects.values_list("pk", flat=True)
+        }
+        for recipe_id, feature in feature_rows():
+            recipes.setdefault(recipe_id, set()).add(feature)
+        loaded = time.perf_counter()
+        rows = related_recipes(recipes)
+        with transaction.atomic():
+            RelatedRecipes.objects.all().delete()
+            while True:
+                batch = list(islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+                RelatedRecipes.objects.bulk_create(batch)
+        self.stdout.write(
+            f"Related {len(recipes)} recipes: loaded features in "
+            f"{loaded - started:.2f}s, computed and saved in "
+            f"{time.perf_counter() - loaded:.2f}s."
+        )
@@ -0,0 +1,74 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription
+from users.models import User, UserStats
+
+BATCH_SIZE = 500
+
+
+def count_by(queryset, field):
+    """Subquery counting rows of queryset that point to the outer row."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    """Custom command to recompute denormalized counters."""
+
+    help = "Recomputes recipe and user counters and repairs any drift"
+
+    @staticmethod
+    def repair(queryset, counters):
+        """Return the number of drifted rows of queryset and fix them."""
+        queryset = queryset.annotate(
+            **{f"actual_{field}": value for field, value in counters}
+        ).exclude(**{field: F(f"actual_{field}") for field, _ in counters})
+        drifted = list(queryset.values_list("pk", flat=True))
+        for start in range(0, len(drifted), BATCH_SIZE):
+            queryset.model.objects.filter(
+                pk__in=drifted[start:start + BATCH_SIZE]
+            ).update(**dict(counters))
+        return len(drifted)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            UserStats.objects.bulk_create(
+                [
+                    UserStats(user_id=pk)
+                    for pk in User.objects.filter(
+                        stats__isnull=True
+                    ).values_list("pk", flat=True)
+                ],
+                ignore_conflicts=True,
+            )
+            recipes = self.repair(
+                Recipe.objects.all(),
+                (
+                    ("favorites_count", count_by(Favorite.objects, "recipe")),
+                    ("cart_count", count_by(ShoppingCart.objects, "recipe")),
+                ),
+            )
+            users = self.repair(
+                UserStats.objects.all(),
+                (
+                    ("recipes_count", count_by(Recipe.objects, "author")),
+                    (
+                        "followers_count",
+                        count_by(Subscription.objects, "author"),
+                    ),
+                ),
+            )
+        self.stdout.write(
+            f"Repaired counters of {recipes} recipes and {users} users."
+        )
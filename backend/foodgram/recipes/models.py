@@ -1,7 +1,9 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
+from .storage import content_hash_path, image_storage
 
 
 class Ingredient(models.Model):
@@ -49,6 +51,21 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queryset with helpers for the read-only endpoints."""
+
+    def with_related(self):
+        return self.select_related("author").prefetch_related(
+            "tags",
+            models.Prefetch(
+                "recipeingredient_set",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ).order_by("pk"),
+            ),
+        )
+
+
 class Recipe(models.Model):
     """Recipe model."""
 
@@ -63,9 +80,16 @@ class Recipe(models.Model):
         verbose_name="Name",
     )
     image = models.ImageField(
-        upload_to="images/",
+        upload_to=content_hash_path,
+        storage=image_storage,
         verbose_name="Image",
     )
+    processed_image = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name="Image the variants were made from",
+    )
     text = models.TextField(
         verbose_name="Description",
     )
@@ -85,14 +109,94 @@ class Recipe(models.Model):
         verbose_name="Cooking time",
         help_text="in minutes",
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Favorites",
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Shopping carts",
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Updated",
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ["name"]
+        ordering = ["-id"]
+        indexes = [
+            models.Index(
+                fields=["author", "-id"],
+                name="recipe_author_id_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeScore(models.Model):
+    """Precomputed popularity and trending scores of a recipe."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="score",
+        verbose_name="Recipe",
+    )
+    popularity = models.FloatField(
+        default=0,
+        verbose_name="Popularity",
+    )
+    trending = models.FloatField(
+        default=0,
+        verbose_name="Trending",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-popularity", "-recipe"],
+                name="recipe_score_popularity_idx",
+            ),
+            models.Index(
+                fields=["-trending", "-recipe"],
+                name="recipe_score_trending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Scores of {self.recipe}"
+
+
+class RelatedRecipes(models.Model):
+    """Precomputed most similar recipes of a recipe."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="related",
+        verbose_name="Recipe",
+    )
+    neighbours = models.BinaryField(
+        default=b"",
+        verbose_name="Packed (recipe id, similarity) pairs, best first",
+    )
+    norm = models.FloatField(
+        default=0,
+        verbose_name="Length of the recipe feature vector",
+    )
+
+    def __str__(self):
+        return f"Recipes related to {self.recipe}"
+
+
 class RecipeIngredient(models.Model):
     """Supportive model for recipes & ingredients relation."""
 
@@ -112,7 +216,12 @@ class RecipeIngredient(models.Model):
     )
 
     class Meta:
-        ordering = ["recipe"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "ingredient"],
+                name="unique_recipe_ingredient",
+            )
+        ]
 
     def __str__(self):
         return f"{self.ingredient} in {self.recipe}"
@@ -144,6 +253,46 @@ class Subscription(models.Model):
         return f"{self.user} is subscribed to {self.author}"
 
 
+class TimelineEntry(models.Model):
+    """Recipe of a followed author in the feed of a user."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="User",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Recipe",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Author",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_timeline_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-recipe"],
+                name="timeline_user_recipe_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} in the feed of {self.user}"
+
+
 class Favorite(models.Model):
     """Favorite model."""
 
@@ -157,6 +306,11 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name="is_favorited",
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name="Added",
+    )
 
     class Meta:
         constraints = [
@@ -183,6 +337,19 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name="is_in_shopping_cart",
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name="Added",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_shopping_cart",
+            )
+        ]
 
     def __str__(self):
         return f"{self.recipe} is in shopping cart of {self.user}"
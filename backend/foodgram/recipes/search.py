@@ -0,0 +1,180 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeIngredient
+
+TABLE = "recipes_recipesearch"
+RECIPE_ID = f"{Recipe._meta.db_table}.id"
+WORD = re.compile(r"\w+")
+
+
+def documents(recipe_ids):
+    """Name, ingredient names and text of recipes, for search documents."""
+    ingredients = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list("recipe_id", "ingredient__name"):
+        ingredients[recipe_id].append(name)
+    return [
+        (pk, name, " ".join(ingredients[pk]), text)
+        for pk, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list("pk", "name", "text")
+    ]
+
+
+class SearchBackend:
+    """Stores search documents and finds recipes by them."""
+
+    create = ()
+    key = None
+
+    def delete(self, cursor, recipe_ids):
+        if self.key:
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE {self.key} = %s",
+                [(pk,) for pk in recipe_ids],
+            )
+
+    def write(self, cursor, rows):
+        raise NotImplementedError
+
+    def search(self, queryset, text):
+        raise NotImplementedError
+
+
+class PostgresSearch(SearchBackend):
+    """Weighted tsvector per recipe with a GIN index."""
+
+    key = "recipe_id"
+    create = (
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+        "recipe_id integer PRIMARY KEY REFERENCES recipes_recipe (id) "
+        "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx "
+        f"ON {TABLE} USING gin (document)",
+    )
+    upsert = (
+        f"INSERT INTO {TABLE} (recipe_id, document) VALUES (%s, "
+        "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+        "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+        "setweight(to_tsvector(%s::regconfig, %s), 'C')) "
+        "ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+    query = "websearch_to_tsquery(%s::regconfig, %s)"
+
+    def write(self, cursor, rows):
+        config = settings.RECIPE_SEARCH_CONFIG
+        cursor.executemany(
+            self.upsert,
+            [
+                (pk, config, name, config, ingredients, config, text)
+                for pk, name, ingredients, text in rows
+            ],
+        )
+
+    def search(self, queryset, text):
+        params = (settings.RECIPE_SEARCH_CONFIG, text)
+        return queryset.extra(
+            where=[
+                f"{RECIPE_ID} IN (SELECT recipe_id FROM {TABLE} "
+                f"WHERE document @@ {self.query})"
+            ],
+            params=params,
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT ts_rank(document, {self.query}) FROM {TABLE} "
+                f"WHERE recipe_id = {RECIPE_ID}",
+                params,
+            )
+        ).order_by("-search_rank", "-id")
+
+
+class SqliteSearch(SearchBackend):
+    """FTS5 table with name, ingredients and text columns, keyed by rowid."""
+
+    key = "rowid"
+    create = (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "name, ingredients, text, tokenize='unicode61 remove_diacritics 2')",
+    )
+    weights = "10.0, 4.0, 1.0"
+
+    def write(self, cursor, rows):
+        self.delete(cursor, [row[0] for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, name, ingredients, text) "
+            "VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+    def search(self, queryset, text):
+        words = WORD.findall(text)
+        if not words:
+            return queryset.none()
+        match = " ".join(f'"{word}"' for word in words)
+        return queryset.extra(
+            where=[
+                f"{RECIPE_ID} IN "
+                f"(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)"
+            ],
+            params=(match,),
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT -bm25({TABLE}, {self.weights}) FROM {TABLE} "
+                f"WHERE {TABLE} MATCH %s "
+                f"AND rowid = {RECIPE_ID}",
+                (match,),
+            )
+        ).order_by("-search_rank", "-id")
+
+
+class FallbackSearch(SearchBackend):
+    """Unindexed substring search for other databases."""
+
+    def write(self, cursor, rows):
+        pass
+
+    def search(self, queryset, text):
+        return queryset.filter(
+            Q(name__icontains=text)
+            | Q(text__icontains=text)
+            | Q(ingredients__name__icontains=text)
+        ).distinct()
+
+
+BACKENDS = {"postgresql": PostgresSearch(), "sqlite": SqliteSearch()}
+FALLBACK = FallbackSearch()
+
+
+def get_backend(using="default"):
+    return BACKENDS.get(connections[using].vendor, FALLBACK)
+
+
+def create_search_table(using="default", **kwargs):
+    """Create the search table if missing, run after migrate."""
+    with connections[using].cursor() as cursor:
+        for statement in get_backend(using).create:
+            cursor.execute(statement)
+
+
+def update_search_documents(recipe_ids):
+    """Rebuild the search documents of the given recipes."""
+    with connections["default"].cursor() as cursor:
+        get_backend().write(cursor, documents(recipe_ids))
+
+
+def delete_search_documents(recipe_ids):
+    with connections["default"].cursor() as cursor:
+        get_backend().delete(cursor, recipe_ids)
+
+
+def search_recipes(queryset, text):
+    """Recipes of queryset matching text, most relevant first."""
+    return get_backend().search(queryset, text)
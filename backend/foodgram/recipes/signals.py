@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.list_cache import invalidate_ranked_lists
+from users.models import User, UserStats
+from .models import (
+    Favorite,
+    Recipe,
+    RecipeScore,
+    ShoppingCart,
+    Subscription,
+)
+from .images import schedule_recipe_image
+from .search import delete_search_documents
+
+COUNTER_FIELDS = {
+    Favorite: "favorites_count",
+    ShoppingCart: "cart_count",
+}
+
+
+def increment(queryset, field):
+    return queryset.update(**{field: F(field) + 1})
+
+
+def decrement(queryset, field):
+    return queryset.filter(**{f"{field}__gt": 0}).update(
+        **{field: F(field) - 1}
+    )
+
+
+def increment_user_counter(user_id, field):
+    if not increment(UserStats.objects.filter(user_id=user_id), field):
+        UserStats.objects.get_or_create(
+            user_id=user_id,
+            defaults={
+                "recipes_count": Recipe.objects.filter(
+                    author_id=user_id
+                ).count(),
+                "followers_count": Subscription.objects.filter(
+                    author_id=user_id
+                ).count(),
+            },
+        )
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def update_popularity(sender, recipe_ids, sign):
+    weight = settings.RECIPE_SCORE_WEIGHTS[sender._meta.model_name]
+    RecipeScore.objects.filter(recipe_id__in=recipe_ids).update(
+        popularity=F("popularity") + sign * weight
+    )
+    transaction.on_commit(invalidate_ranked_lists)
+
+
+def adjust_recipe_counters(sender, recipe_ids, sign):
+    """Count recipes added to (sign 1) or removed from favorites or cart."""
+    recipes = Recipe.objects.filter(pk__in=recipe_ids)
+    if sign > 0:
+        increment(recipes, COUNTER_FIELDS[sender])
+    else:
+        decrement(recipes, COUNTER_FIELDS[sender])
+    update_popularity(sender, recipe_ids, sign)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        increment_user_counter(instance.author_id, "recipes_count")
+        RecipeScore.objects.create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, **kwargs):
+    if instance.image and instance.image.name != instance.processed_image:
+        transaction.on_commit(lambda: schedule_recipe_image(instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    delete_search_documents([instance.pk])
+    decrement(
+        UserStats.objects.filter(user_id=instance.author_id), "recipes_count"
+    )
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(instance, created, **kwargs):
+    if created:
+        increment_user_counter(instance.author_id, "followers_count")
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(instance, **kwargs):
+    decrement(
+        UserStats.objects.filter(user_id=instance.author_id),
+        "followers_count",
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        adjust_recipe_counters(sender, [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_removed(sender, instance, **kwargs):
+    adjust_recipe_counters(sender, [instance.recipe_id], -1)
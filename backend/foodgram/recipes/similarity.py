@@ -0,0 +1,278 @@
+import logging
+import math
+import struct
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from heapq import nlargest
+from itertools import chain
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Recipe, RecipeIngredient, RelatedRecipes
+
+INGREDIENT = "ingredient"
+TAG = "tag"
+SOURCES = {
+    INGREDIENT: (RecipeIngredient, "ingredient_id"),
+    TAG: (Recipe.tags.through, "tag_id"),
+}
+PAIR = struct.Struct("<if")
+SCORE = itemgetter(1)
+CANDIDATES_PER_NEIGHBOUR = 4
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RELATED_RECIPES_WORKERS,
+    thread_name_prefix="related-recipes",
+)
+pending = threading.BoundedSemaphore(settings.RELATED_RECIPES_QUEUE_SIZE)
+
+
+def pack(pairs):
+    return b"".join(PAIR.pack(pk, score) for pk, score in pairs)
+
+
+def unpack(data):
+    return list(PAIR.iter_unpack(bytes(data or b"")))
+
+
+def feature_rows(recipe_ids=None, features=None):
+    """(recipe id, feature) pairs, optionally limited to some of both."""
+    for kind, (model, field) in SOURCES.items():
+        rows = model.objects.order_by().values_list("recipe_id", field)
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        if features is not None:
+            rows = rows.filter(
+                **{f"{field}__in": [pk for key, pk in features if key == kind]}
+            )
+        for recipe_id, pk in rows.iterator():
+            yield recipe_id, (kind, pk)
+
+
+def frequencies(features):
+    """Number of recipes having each of the features."""
+    counts = Counter()
+    for kind, (model, field) in SOURCES.items():
+        rows = (
+            model.objects.filter(
+                **{f"{field}__in": [pk for key, pk in features if key == kind]}
+            )
+            .order_by()
+            .values(field)
+            .annotate(count=Count("recipe_id"))
+            .values_list(field, "count")
+        )
+        counts.update({(kind, pk): count for pk, count in rows})
+    return counts
+
+
+def recent_postings(features, limit):
+    """Newest recipes having each of the features, at most limit per one.
+
+    Recipes are paired with the inverse of their stored vector norm; ones
+    not in RelatedRecipes yet are left out.
+    """
+    postings = {}
+    for kind, pk in features:
+        model, field = SOURCES[kind]
+        rows = (
+            model.objects.filter(**{field: pk})
+            .order_by("-recipe_id")
+            .values_list("recipe_id", "recipe__related__norm")[:limit]
+        )
+        postings[kind, pk] = [
+            (recipe_id, 1 / norm) for recipe_id, norm in rows if norm
+        ]
+    return postings
+
+
+class Similarity:
+    """Cosine similarity of IDF-weighted ingredient and tag sets.
+
+    Candidates are gathered from postings of the rarest features first,
+    at most RELATED_RECIPES_MAX_POSTINGS newest recipes per feature, and
+    more common ones are skipped once they can no longer lift a new recipe
+    into the candidates, so staples shared by half of the recipes do not
+    make every pair a candidate. Candidates are then scored exactly on all
+    shared features.
+    """
+
+    def __init__(self, total, frequencies):
+        self.squares = {
+            feature: self.weight(feature, total, count) ** 2
+            for feature, count in frequencies.items()
+        }
+
+    @staticmethod
+    def weight(feature, total, count):
+        weight = math.log((1 + total) / (1 + count)) + 1
+        if feature[0] == TAG:
+            weight *= settings.RELATED_RECIPES_TAG_WEIGHT
+        return weight
+
+    def norm(self, features):
+        return math.sqrt(sum(self.squares[feature] for feature in features))
+
+    def candidates(self, recipe_id, features, postings):
+        """Recipes sharing the most weight of features, relative to size.
+
+        Postings map features to (recipe id, 1 / recipe norm) pairs. A
+        recipe first seen in a feature with remaining squared weight r
+        cannot score above sqrt(r), which bounds the postings to read.
+        """
+        limit = settings.RELATED_RECIPES_COUNT * CANDIDATES_PER_NEIGHBOUR
+        scores = {}
+        remaining = sum(self.squares[feature] for feature in features)
+        for feature in sorted(features, key=self.squares.get, reverse=True):
+            posting = postings.get(feature, ())
+            if len(scores) > limit and (
+                len(posting) >= settings.RELATED_RECIPES_MAX_POSTINGS
+                or math.sqrt(max(remaining, 0))
+                <= min(nlargest(limit + 1, scores.values()))
+            ):
+                break
+            square = self.squares[feature]
+            remaining -= square
+            score = scores.get
+            for pk, inverse_norm in posting:
+                scores[pk] = score(pk, 0) + square * inverse_norm
+        scores.pop(recipe_id, None)
+        return [pk for pk, _ in nlargest(limit, scores.items(), key=SCORE)]
+
+    def cosine(self, shared, norm, other_norm):
+        if not norm or not other_norm:
+            return 0
+        return self.norm(shared) ** 2 / (norm * other_norm)
+
+
+def related_recipes(recipes):
+    """RelatedRecipes of every recipe, from a mapping to feature sets."""
+    similarity = Similarity(
+        len(recipes), Counter(chain.from_iterable(recipes.values()))
+    )
+    norms = {pk: similarity.norm(features) for pk, features in recipes.items()}
+    postings = defaultdict(list)
+    for pk in sorted(recipes, reverse=True):
+        for feature in recipes[pk]:
+            if len(postings[feature]) < settings.RELATED_RECIPES_MAX_POSTINGS:
+                postings[feature].append((pk, 1 / norms[pk]))
+    for pk, features in recipes.items():
+        scores = [
+            (
+                other,
+                similarity.cosine(
+                    features & recipes[other], norms[pk], norms[other]
+                ),
+            )
+            for other in similarity.candidates(pk, features, postings)
+        ]
+        yield RelatedRecipes(
+            recipe_id=pk,
+            norm=norms[pk],
+            neighbours=pack(
+                nlargest(settings.RELATED_RECIPES_COUNT, scores, key=SCORE)
+            ),
+        )
+
+
+def merge_neighbour(row, recipe_id, score):
+    """Put recipe_id with its new score into the neighbours of row."""
+    pairs = [pair for pair in unpack(row.neighbours) if pair[0] != recipe_id]
+    if score:
+        pairs.append((recipe_id, score))
+    neighbours = pack(
+        nlargest(settings.RELATED_RECIPES_COUNT, pairs, key=SCORE)
+    )
+    if neighbours == bytes(row.neighbours):
+        return False
+    row.neighbours = neighbours
+    return True
+
+
+def update_recipe(recipe_id):
+    features = {feature for _, feature in feature_rows([recipe_id])}
+    similarity = Similarity(Recipe.objects.count(), frequencies(features))
+    candidates = similarity.candidates(
+        recipe_id,
+        features,
+        recent_postings(features, settings.RELATED_RECIPES_MAX_POSTINGS),
+    )
+    shared = defaultdict(set)
+    for pk, feature in feature_rows(candidates, features):
+        shared[pk].add(feature)
+    row = RelatedRecipes.objects.filter(recipe_id=recipe_id).first()
+    if row is None:
+        row = RelatedRecipes(recipe_id=recipe_id)
+    row.norm = similarity.norm(features)
+    rows = RelatedRecipes.objects.in_bulk(
+        set(candidates) | {pk for pk, _ in unpack(row.neighbours)}
+    )
+    scores = {
+        pk: similarity.cosine(shared[pk], row.norm, rows[pk].norm)
+        for pk in candidates
+        if pk in rows
+    }
+    row.neighbours = pack(
+        nlargest(settings.RELATED_RECIPES_COUNT, scores.items(), key=SCORE)
+    )
+    row.save()
+    RelatedRecipes.objects.bulk_update(
+        [
+            other
+            for other in rows.values()
+            if merge_neighbour(other, recipe_id, scores.get(other.pk))
+        ],
+        ["neighbours"],
+    )
+
+
+def update_related_recipes(recipe_ids):
+    """Recompute neighbours of changed recipes and fix up theirs in turn.
+
+    Recipes that list a changed recipe but are no longer among its
+    candidates keep the old score until the next refresh_related_recipes.
+    """
+    with transaction.atomic():
+        for recipe_id in recipe_ids:
+            update_recipe(recipe_id)
+
+
+def run(recipe_ids, release=False):
+    try:
+        update_related_recipes(recipe_ids)
+    except Exception:
+        logger.exception("Updating recipes related to %s failed", recipe_ids)
+    finally:
+        if release:
+            pending.release()
+            connection.close()
+
+
+def schedule_related_recipes(recipe_ids):
+    """Update related recipes on the worker pool, or inline when it is full.
+
+    Meant to be called once the change commits, so the update reads it and
+    does not hold the locks of the request transaction.
+    """
+    if settings.RELATED_RECIPES_ASYNC and pending.acquire(blocking=False):
+        executor.submit(run, recipe_ids, release=True)
+    else:
+        run(recipe_ids)
+
+
+def related_recipe_ids(recipe_id):
+    """Ids of the most similar recipes, None when not computed yet."""
+    neighbours = (
+        RelatedRecipes.objects.filter(recipe_id=recipe_id)
+        .values_list("neighbours", flat=True)
+        .first()
+    )
+    if neighbours is None:
+        return None
+    return [pk for pk, _ in unpack(neighbours)]
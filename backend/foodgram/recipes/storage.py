@@ -0,0 +1,54 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash_path(instance, filename):
+    """Name a recipe image after the SHA-256 of its content."""
+    digest = hashlib.sha256()
+    for chunk in instance.image.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+    extension = os.path.splitext(filename)[1].lower()
+    return f"images/{digest[:2]}/{digest}{extension}"
+
+
+class DeduplicatingStorage(FileSystemStorage):
+    """File system storage keeping one copy of each file name.
+
+    Meant for content-addressed names: an existing file is reused rather
+    than saved again under a new name, and new files appear atomically.
+    A reused file gets a fresh modification time, so collect_orphan_images
+    does not take it for an old orphan while its new recipe commits.
+    """
+
+    temp_prefix = ".tmp-"
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=directory, prefix=self.temp_prefix
+        )
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return name
+
+
+image_storage = DeduplicatingStorage()
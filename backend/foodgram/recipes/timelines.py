@@ -0,0 +1,138 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from users.models import UserStats
+from .models import Recipe, Subscription, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.FEED_WORKERS,
+    thread_name_prefix="timelines",
+)
+pending = threading.BoundedSemaphore(settings.FEED_QUEUE_SIZE)
+
+
+def is_fanned_out(followers_count):
+    """Whether recipes of an author are written to follower timelines."""
+    return (followers_count or 0) <= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def insert_entries(entries):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.FEED_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe_id):
+    """Add a new recipe to the timelines of its author's followers."""
+    recipe = (
+        Recipe.objects.filter(pk=recipe_id)
+        .values_list("author_id", "author__stats__followers_count")
+        .first()
+    )
+    if recipe is None or not is_fanned_out(recipe[1]):
+        return
+    author_id = recipe[0]
+    followers = Subscription.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    insert_entries(
+        TimelineEntry(
+            user_id=user_id, recipe_id=recipe_id, author_id=author_id
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Add the latest recipes of a newly followed author to a timeline."""
+    followers_count = (
+        UserStats.objects.filter(user_id=author_id)
+        .values_list("followers_count", flat=True)
+        .first()
+    )
+    if not is_fanned_out(followers_count):
+        return
+    recipes = (
+        Recipe.objects.filter(author_id=author_id)
+        .order_by("-id")
+        .values_list("id", flat=True)
+    )
+    insert_entries(
+        TimelineEntry(
+            user_id=user_id, recipe_id=recipe_id, author_id=author_id
+        )
+        for recipe_id in recipes[: settings.FEED_BACKFILL_SIZE]
+    )
+
+
+def prune(user_id, author_id):
+    """Remove recipes of an unfollowed author from a timeline."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def run(task, *args, release=False):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception("Timeline task %s%r failed", task.__name__, args)
+    finally:
+        if release:
+            pending.release()
+            connection.close()
+
+
+def schedule_timeline_task(task, *args):
+    """Run a timeline task on the worker pool, or inline when it is full."""
+    if settings.FEED_ASYNC and pending.acquire(blocking=False):
+        executor.submit(run, task, *args, release=True)
+    else:
+        run(task, *args)
+
+
+def feed_recipe_ids(user, before, limit):
+    """Ids of the newest recipes of authors the user follows.
+
+    Recipes of authors with more than FEED_FANOUT_MAX_FOLLOWERS followers
+    are not fanned out and are read from the recipes table instead. Only
+    current subscriptions are read, so timeline entries that are not yet
+    pruned, or were fanned out during an unsubscribe, never show up.
+    """
+    fanned_out, pulled = [], []
+    for author_id, followers_count in Subscription.objects.filter(
+        user=user
+    ).values_list("author_id", "author__stats__followers_count"):
+        if is_fanned_out(followers_count):
+            fanned_out.append(author_id)
+        else:
+            pulled.append(author_id)
+    sources = []
+    if fanned_out:
+        sources.append(
+            (
+                TimelineEntry.objects.filter(
+                    user=user, author_id__in=fanned_out
+                ),
+                "recipe_id",
+            )
+        )
+    if pulled:
+        sources.append((Recipe.objects.filter(author_id__in=pulled), "id"))
+    recipe_ids = []
+    for queryset, field in sources:
+        if before is not None:
+            queryset = queryset.filter(**{f"{field}__lt": before})
+        queryset = queryset.order_by(f"-{field}").values_list(
+            field, flat=True
+        )
+        recipe_ids.extend(queryset[:limit])
+    return sorted(recipe_ids, reverse=True)[:limit]
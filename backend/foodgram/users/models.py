@@ -1,3 +1,27 @@
 from django.contrib.auth import get_user_model
+from django.db import models
 
 User = get_user_model()
+
+
+class UserStats(models.Model):
+    """Denormalized counters of a user, maintained by recipes signals."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name="User",
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Recipes",
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Followers",
+    )
+
+    def __str__(self):
+        return f"Stats of {self.user}"